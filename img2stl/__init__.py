@@ -0,0 +1,56 @@
+# Convert image silhouettes to extruded STL meshes.
+#
+# Importing the package is cheap: the names below are loaded from their
+# submodules on first use, and OpenCV, shapely, triangle and friends are
+# only imported by the stages that need them.
+
+import importlib
+
+_EXPORTS = {
+    "process_image_to_stl": "pipeline",
+    "image_to_polygons": "pipeline",
+    "convert_svg_to_3d": "pipeline",
+    "image_to_svg_silhouette_adaptive": "pipeline",
+    "warm_up": "pipeline",
+    "load_grayscale": "raster",
+    "threshold_image": "raster",
+    "find_silhouette_contours": "raster",
+    "contours_to_shapely_polygons": "geometry",
+    "union_overlapping": "geometry",
+    "polygon_parts": "geometry",
+    "svg_to_shapely_polygons": "svg",
+    "write_contours_svg": "svg",
+    "extrude_polygon": "extrude",
+    "extrude_polygons": "extrude",
+    "shapely_to_trimesh": "extrude",
+    "write_polygons_stl": "extrude",
+    "simplify_polygons": "simplify",
+    "tiled_image_to_stl": "tiled",
+    "relief_image_to_stl": "relief",
+    "ThresholdPreview": "preview",
+    "StlWriter": "stl",
+    "PlyWriter": "export",
+    "ObjWriter": "export",
+    "ThreeMfWriter": "export",
+    "mesh_writer": "export",
+    "SharedArray": "shared",
+    "ResultCache": "cache",
+    "Instrumentation": "instrument",
+    "convert_batch": "batch",
+    "convert_batch_async": "aio",
+    "ConversionService": "service",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,156 @@
+import asyncio
+import contextlib
+import io
+import itertools
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from .pipeline import array_to_stl, warm_up
+from .shared import SharedArray, temp_path
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def decode_image(data, path):
+    # Runs in an I/O thread; cv2.imdecode releases the GIL. The decoded
+    # image goes into shared memory so the geometry worker maps it instead
+    # of unpickling a copy.
+    import cv2
+
+    if path.lower().endswith(".npy"):
+        img = np.load(io.BytesIO(data))
+    else:
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError("Failed to load image")
+    return SharedArray.copy_of(img)
+
+
+def mesh_shared_image(image, options, extension=".stl"):
+    # Worker side: threshold through extrusion, with the mesh written to a
+    # shared file that the parent copies to its destination. extension
+    # picks the mesh format.
+    stl_path = temp_path(extension)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            array_to_stl(image.array, stl_path, **options)
+    except BaseException:
+        os.remove(stl_path)
+        raise
+    finally:
+        image.close()
+    return SharedArray.adopt(stl_path).transfer()
+
+
+class AsyncPipeline:
+    # Overlaps the I/O and CPU halves of many conversions. Reading and
+    # decoding run in a thread pool, the geometry stages in warm worker
+    # processes and the STL writes in the thread pool again, so while one
+    # image is being meshed the next ones are already being fetched and
+    # the previous ones written. At most `window` images are in flight at
+    # once, which bounds memory.
+    #
+    # options are passed to pipeline.array_to_stl (block_size, C, height,
+    # simplify_tolerance, max_triangles).
+
+    def __init__(self, workers=None, window=None, io_threads=4, **options):
+        self.workers = workers or os.cpu_count()
+        self.window = window or 2 * self.workers
+        self.io_threads = io_threads
+        self.options = options
+
+    def process_pool(self, workers):
+        return ProcessPoolExecutor(workers, initializer=warm_up)
+
+    async def convert_one(self, image_path, stl_path, slots, io_pool, executor):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        image = stl = None
+        async with slots:
+            try:
+                data = await loop.run_in_executor(io_pool, read_file, image_path)
+                image = await loop.run_in_executor(io_pool, decode_image, data, image_path)
+                del data
+                stl = await loop.run_in_executor(executor, mesh_shared_image, image, self.options,
+                                                 os.path.splitext(stl_path)[1] or ".stl")
+                image.close()
+                await loop.run_in_executor(io_pool, shutil.copyfile, stl.path, stl_path)
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                return {"input": image_path, "output": None, "ok": False,
+                        "seconds": time.perf_counter() - start, "error": f"{type(e).__name__}: {e}"}
+            finally:
+                for shared in (image, stl):
+                    if shared is not None:
+                        shared.close()
+        return {"input": image_path, "output": stl_path, "ok": True,
+                "seconds": time.perf_counter() - start, "error": None}
+
+    async def run(self, image_paths, stl_paths):
+        # Results come back in input order. As in batch.convert_batch, the
+        # images that fail with BrokenProcessPool because some worker died
+        # are retried one at a time in a single-worker pool, so only an
+        # image that kills its worker again is recorded as failed.
+        slots = asyncio.Semaphore(self.window)
+        results = [None] * len(image_paths)
+        # The pool forks its workers lazily, when the I/O threads are
+        # already decoding. A child forked while one of them holds the
+        # import lock (decode_image imports cv2) deadlocks in warm_up, so
+        # everything is imported here first, before any thread exists; the
+        # workers then inherit the modules and the threads import nothing.
+        warm_up()
+        progress = itertools.count(1)
+
+        def record(i, result):
+            results[i] = result
+            status = "ok" if result["ok"] else "FAILED"
+            print(f"[{next(progress)}/{len(results)}] {status} {result['input']} ({result['seconds']:.2f}s)")
+
+        broken = []
+        with ThreadPoolExecutor(self.io_threads) as io_pool:
+            with self.process_pool(self.workers) as executor:
+                tasks = {asyncio.ensure_future(self.convert_one(image_path, stl_path, slots, io_pool, executor)): i
+                         for i, (image_path, stl_path) in enumerate(zip(image_paths, stl_paths))}
+                pending = set(tasks)
+                while pending:
+                    finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in finished:
+                        if isinstance(task.exception(), BrokenProcessPool):
+                            broken.append(tasks[task])
+                        else:
+                            record(tasks[task], task.result())
+
+            if broken:
+                print(f"A worker process died; retrying {len(broken)} unfinished images one at a time.")
+            executor = None
+            try:
+                for i in sorted(broken):
+                    if executor is None:
+                        executor = self.process_pool(1)
+                    start = time.perf_counter()
+                    try:
+                        result = await self.convert_one(image_paths[i], stl_paths[i], slots, io_pool, executor)
+                    except BrokenProcessPool:
+                        executor.shutdown()
+                        executor = None
+                        result = {"input": image_paths[i], "output": None, "ok": False,
+                                  "seconds": time.perf_counter() - start,
+                                  "error": "BrokenProcessPool: the worker process died converting this image"}
+                    record(i, result)
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+        return results
+
+
+def convert_batch_async(image_paths, stl_paths, workers=None, window=None, **options):
+    return asyncio.run(AsyncPipeline(workers, window, **options).run(image_paths, stl_paths))
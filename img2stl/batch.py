@@ -0,0 +1,239 @@
+import argparse
+import contextlib
+import glob
+import io
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from .cache import ResultCache
+from .instrument import Instrumentation, JsonLinesSink
+from .pipeline import process_image_to_stl
+from .threshold import THRESHOLD_METHODS
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp", ".tif", ".tiff", ".pgm", ".npy")
+
+
+def collect_images(sources):
+    # Each source is either a directory (its images, not recursive) or a
+    # glob pattern such as "scans/**/*.png". Images matched twice are only
+    # converted once.
+    paths = []
+    seen = set()
+    for source in sources:
+        if os.path.isdir(source):
+            candidates = [os.path.join(source, name) for name in sorted(os.listdir(source))]
+        else:
+            candidates = sorted(glob.glob(source, recursive=True))
+        for path in candidates:
+            key = os.path.abspath(path)
+            if key in seen or not os.path.isfile(path) or not path.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            seen.add(key)
+            paths.append(path)
+    return paths
+
+
+def output_paths(image_paths, output_dir=None, extension=".stl"):
+    # <stem>.stl (or another extension) next to the image, or in
+    # output_dir. Inputs that would end
+    # up with the same name get a numeric suffix instead of overwriting
+    # each other.
+    taken = set()
+    outputs = []
+    for path in image_paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        directory = output_dir or os.path.dirname(os.path.abspath(path))
+        candidate = os.path.join(directory, f"{stem}{extension}")
+        n = 1
+        while candidate in taken:
+            candidate = os.path.join(directory, f"{stem}_{n}{extension}")
+            n += 1
+        taken.add(candidate)
+        outputs.append(candidate)
+    return outputs
+
+
+def convert_one(image_path, stl_path, options, verbose=False, metrics_path=None):
+    start = time.perf_counter()
+    log = io.StringIO()
+    instrument = None
+    if metrics_path:
+        instrument = Instrumentation([JsonLinesSink(metrics_path)], image=image_path)
+    try:
+        # The pipeline reports progress with print; keep worker output from
+        # interleaving unless asked for.
+        with contextlib.redirect_stdout(sys.stdout if verbose else log):
+            process_image_to_stl(image_path, stl_path, instrument=instrument, **options)
+    except Exception as e:
+        return {"input": image_path, "output": None, "ok": False,
+                "seconds": time.perf_counter() - start, "error": f"{type(e).__name__}: {e}"}
+    return {"input": image_path, "output": stl_path, "ok": True,
+            "seconds": time.perf_counter() - start, "error": None}
+
+
+def convert_batch(image_paths, output_dir=None, workers=None, verbose=False, metrics_path=None,
+                  extension=".stl", **options):
+    # options are passed through to process_image_to_stl (block_size, C,
+    # height, ...). Results come back in input order. With metrics_path,
+    # per-stage timings of every image are appended to it as JSON lines.
+    # extension picks the mesh format (see export.py).
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    outputs = output_paths(image_paths, output_dir, extension)
+
+    results = [None] * len(image_paths)
+    progress = itertools.count(1)
+
+    def record(i, result):
+        results[i] = result
+        status = "ok" if result["ok"] else "FAILED"
+        print(f"[{next(progress)}/{len(results)}] {status} {result['input']} ({result['seconds']:.2f}s)")
+
+    # A worker that dies (killed for memory, a crash in native code) breaks
+    # the pool, and every image not finished by then fails with
+    # BrokenProcessPool without having been the cause. Those images are
+    # retried one at a time in a single-worker pool, so an image that kills
+    # its worker again is recorded as failed and the pool replaced.
+    broken = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(convert_one, image_path, stl_path, options, verbose, metrics_path): i
+            for i, (image_path, stl_path) in enumerate(zip(image_paths, outputs))
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                broken.append(futures[future])
+                continue
+            record(futures[future], result)
+
+    if broken:
+        print(f"A worker process died; retrying {len(broken)} unfinished images one at a time.")
+    executor = None
+    try:
+        for i in sorted(broken):
+            if executor is None:
+                executor = ProcessPoolExecutor(max_workers=1)
+            start = time.perf_counter()
+            try:
+                result = executor.submit(convert_one, image_paths[i], outputs[i], options, verbose,
+                                         metrics_path).result()
+            except BrokenProcessPool:
+                executor.shutdown()
+                executor = None
+                result = {"input": image_paths[i], "output": None, "ok": False,
+                          "seconds": time.perf_counter() - start,
+                          "error": "BrokenProcessPool: the worker process died converting this image"}
+            record(i, result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
+
+
+def print_summary(results, wall_time):
+    failed = [r for r in results if not r["ok"]]
+    busy = sum(r["seconds"] for r in results)
+    print(f"\nConverted {len(results) - len(failed)}/{len(results)} images "
+          f"in {wall_time:.2f}s wall, {busy:.2f}s total worker time.")
+    for r in failed:
+        print(f"  FAILED {r['input']}: {r['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="img2stl",
+        description="Convert image silhouettes to extruded STL files in parallel.")
+    parser.add_argument("sources", nargs="+", help="image directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", help="write STLs here instead of next to each image")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes (default: all cores)")
+    parser.add_argument("--block-size", type=int, default=140, help="adaptive threshold block size")
+    parser.add_argument("-C", type=float, default=0, help="adaptive threshold constant")
+    parser.add_argument("--threshold", choices=THRESHOLD_METHODS, default="mean",
+                        help="thresholding method (default: mean)")
+    parser.add_argument("--threshold-backend", choices=("opencv", "numpy", "auto"), default="opencv",
+                        help="thresholding implementation; auto times the ones that give identical masks "
+                             "on the first image of each size (default: opencv)")
+    parser.add_argument("--open", type=int, default=0, metavar="SIZE",
+                        help="remove specks and bridges thinner than this many pixels from the mask")
+    parser.add_argument("--close", type=int, default=0, metavar="SIZE",
+                        help="fill pinholes and gaps thinner than this many pixels in the mask")
+    parser.add_argument("--min-area", type=int, default=0, metavar="PIXELS",
+                        help="drop blobs and fill holes smaller than this many pixels before contouring")
+    parser.add_argument("--height", type=float, default=10, help="extrusion height")
+    parser.add_argument("--format", choices=("stl", "ply", "obj", "3mf"), default="stl",
+                        help="mesh format of the output files (default: stl)")
+    parser.add_argument("--simplify", type=float, metavar="TOLERANCE",
+                        help="simplify outlines to this tolerance (output units)")
+    parser.add_argument("--max-triangles", type=int, help="simplify outlines to fit this triangle budget")
+    parser.add_argument("--extrude-workers", type=int,
+                        help="extrude the polygons of each image in this many processes (for images with many parts)")
+    parser.add_argument("--tile-size", type=int, help="process each image in tiles of this many pixels")
+    parser.add_argument("--relief", action="store_true",
+                        help="map intensity to height (dark = high) instead of extruding a silhouette")
+    parser.add_argument("--levels", type=int, help="relief mode: quantize to this many stepped layers")
+    parser.add_argument("--relief-max-size", type=int, default=1024,
+                        help="relief mode: shrink images to at most this many grid points per side")
+    parser.add_argument("--cache-dir", help="reuse masks, polygons and meshes cached in this directory")
+    parser.add_argument("--cache-size", type=int, default=1024, help="cache size limit in MB")
+    parser.add_argument("--metrics", help="append per-stage timing/memory records (JSON lines) to this file")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="overlap reading, meshing and writing of images (for slow or network storage)")
+    parser.add_argument("--window", type=int, help="--async: images in flight at once (default: 2 per worker)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show pipeline output")
+    args = parser.parse_args(argv)
+    if args.use_async and (args.cache_dir or args.tile_size or args.relief or args.metrics):
+        parser.error("--async does not support --cache-dir, --tile-size, --relief or --metrics")
+    if args.levels is not None and not args.relief:
+        parser.error("--levels only applies with --relief")
+    if args.tile_size and args.threshold == "otsu":
+        parser.error("--threshold otsu needs the whole image and does not support --tile-size")
+    if args.tile_size and args.min_area:
+        parser.error("--min-area needs the whole image and does not support --tile-size")
+
+    image_paths = collect_images(args.sources)
+    if not image_paths:
+        print("No images found.")
+        return 1
+
+    cache = None
+    if args.cache_dir:
+        cache = ResultCache(args.cache_dir, max_bytes=args.cache_size * 1024 * 1024)
+
+    print(f"Converting {len(image_paths)} images with {args.workers} workers...")
+    start = time.perf_counter()
+    if args.use_async:
+        from .aio import convert_batch_async
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+        outputs = output_paths(image_paths, args.output_dir, "." + args.format)
+        results = convert_batch_async(image_paths, outputs, args.workers,
+                                      args.window, block_size=args.block_size, C=args.C, height=args.height,
+                                      threshold_method=args.threshold, threshold_backend=args.threshold_backend,
+                                      open_size=args.open, close_size=args.close, min_area=args.min_area,
+                                      extrude_workers=args.extrude_workers,
+                                      simplify_tolerance=args.simplify, max_triangles=args.max_triangles)
+        print_summary(results, time.perf_counter() - start)
+        return 0 if all(r["ok"] for r in results) else 1
+    results = convert_batch(image_paths, args.output_dir, args.workers, args.verbose, args.metrics,
+                            "." + args.format,
+                            block_size=args.block_size, C=args.C, height=args.height, cache=cache,
+                            tile_size=args.tile_size,
+                            threshold_method=args.threshold, threshold_backend=args.threshold_backend,
+                            open_size=args.open, close_size=args.close,
+                            min_area=args.min_area, extrude_workers=args.extrude_workers,
+                            simplify_tolerance=args.simplify, max_triangles=args.max_triangles,
+                            relief=args.relief, relief_levels=args.levels, relief_max_size=args.relief_max_size)
+    print_summary(results, time.perf_counter() - start)
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+
+# Synthetic inputs: dark shapes on a light background, generated offline
+# from a fixed seed so every run sees the same pixels.
+
+def make_text(size, rng):
+    img = np.full((size, size), 255, np.uint8)
+    scale = size / 400
+    thickness = max(1, int(round(scale * 2)))
+    line_height = int(40 * scale)
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789&@%"
+    for y in range(line_height, size, line_height):
+        text = "".join(rng.choice(list(letters), 14))
+        cv2.putText(img, text, (int(5 * scale), y), cv2.FONT_HERSHEY_SIMPLEX, scale, 0, thickness,
+                    cv2.LINE_AA)
+    return img
+
+
+def make_speckle(size, rng):
+    noise = rng.random((size, size)).astype(np.float32)
+    noise = cv2.GaussianBlur(noise, (0, 0), 1.5)
+    return np.where(noise > np.quantile(noise, 0.8), 0, 255).astype(np.uint8)
+
+
+def make_rings(size, rng):
+    img = np.full((size, size), 255, np.uint8)
+    cells = 4
+    cell = size // cells
+    for cy in range(cells):
+        for cx in range(cells):
+            center = (cx * cell + cell // 2, cy * cell + cell // 2)
+            for k, radius in enumerate(range(cell // 2 - 2, 2, -max(3, cell // 24))):
+                cv2.circle(img, center, radius, 0 if k % 2 == 0 else 255, -1, cv2.LINE_AA)
+    return img
+
+
+def make_blobs(size, rng):
+    field = np.zeros((size, size), np.float32)
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    for _ in range(8):
+        cx, cy = rng.random(2)
+        sigma = rng.uniform(0.05, 0.15)
+        field += np.exp(-((xx - cx) ** 2 + (yy - cy) ** 2) / (2 * sigma ** 2))
+    return np.where(field > 0.6, 0, 255).astype(np.uint8)
+
+
+GENERATORS = {
+    "text": make_text,
+    "speckle": make_speckle,
+    "rings": make_rings,
+    "blobs": make_blobs,
+}
+
+
+# Timed in a fresh interpreter: importing the library, then warming up the
+# heavy dependencies the way a service worker does.
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import img2stl.pipeline
+imported = time.perf_counter()
+img2stl.pipeline.warm_up()
+warmed = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "warm_s": warmed - imported}))
+"""
+
+
+def measure_startup(repeat=3):
+    # Worker startup cost, best of repeat runs. process_s also includes
+    # starting the interpreter itself.
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=root, check=True,
+                                capture_output=True, text=True).stdout
+        result = json.loads(output)
+        result["process_s"] = time.perf_counter() - start
+        if best is None or result["process_s"] < best["process_s"]:
+            best = result
+    return best
+
+
+def run_case(args):
+    # Runs in a fresh worker process, so peak RSS belongs to this case only.
+    kind, size, image_path, options = args
+    import contextlib
+    import io
+
+    from .instrument import Instrumentation
+    from .pipeline import process_image_to_stl
+
+    records = []
+    instrument = Instrumentation([records.append])
+    stl_path = os.path.splitext(image_path)[0] + ".stl"
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        process_image_to_stl(image_path, stl_path, instrument=instrument, **options)
+    wall = time.perf_counter() - start
+
+    stages = {}
+    for record in records:
+        totals = stages.setdefault(record["stage"], {"wall_s": 0.0, "cpu_s": 0.0})
+        totals["wall_s"] += record["wall_s"]
+        totals["cpu_s"] += record["cpu_s"]
+    triangles = sum(r["items"] for r in records if r["stage"] == "export")
+    return {
+        "kind": kind,
+        "size": size,
+        "wall_s": wall,
+        "megapixels_per_s": size * size / 1e6 / wall,
+        "triangles": triangles,
+        "stl_bytes": os.path.getsize(stl_path),
+        "peak_rss_bytes": max(r["peak_rss_bytes"] or 0 for r in records),
+        "stages": stages,
+    }
+
+
+def run_benchmarks(kinds, sizes, repeat=1, options=None, seed=0):
+    options = options or {}
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in kinds:
+            for size in sizes:
+                image_path = os.path.join(tmp, f"{kind}_{size}.png")
+                cv2.imwrite(image_path, GENERATORS[kind](size, np.random.default_rng(seed)))
+                best = None
+                for _ in range(repeat):
+                    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+                        result = pool.apply(run_case, ((kind, size, image_path, options),))
+                    if best is None or result["wall_s"] < best["wall_s"]:
+                        best = result
+                print(f"{kind:>8} {size:>6}px  {best['wall_s']:8.3f}s  "
+                      f"{best['megapixels_per_s']:8.2f} MP/s  {best['triangles']:>10} tris  "
+                      f"{best['peak_rss_bytes'] / 2**20:8.1f} MB")
+                results.append(best)
+    return results
+
+
+def compare(results, baseline, tolerance=1.2, startup=None):
+    # Cases (and worker startup) that got slower or bigger than the baseline
+    # by more than the tolerance factor.
+    previous = {(r["kind"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    old_startup = baseline.get("startup")
+    if old_startup and startup:
+        for metric in ("import_s", "warm_s"):
+            if startup[metric] > old_startup[metric] * tolerance:
+                regressions.append(("startup", "-", metric, old_startup[metric], startup[metric]))
+    for r in results:
+        old = previous.get((r["kind"], r["size"]))
+        if old is None:
+            continue
+        for metric in ("wall_s", "triangles", "peak_rss_bytes"):
+            if old[metric] and r[metric] > old[metric] * tolerance:
+                regressions.append((r["kind"], r["size"], metric, old[metric], r[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the image to STL pipeline on synthetic images.")
+    parser.add_argument("--kinds", nargs="+", default=list(GENERATORS), choices=list(GENERATORS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[256, 1024, 4096],
+                        help="image sizes in pixels (up to 16384)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case; the fastest is kept")
+    parser.add_argument("--block-size", type=int, default=51)
+    parser.add_argument("-C", type=float, default=5)
+    parser.add_argument("--tile-size", type=int)
+    parser.add_argument("--simplify", type=float, metavar="TOLERANCE")
+    parser.add_argument("--max-triangles", type=int)
+    parser.add_argument("-o", "--output", default="bench_report.json", help="where to write the report")
+    parser.add_argument("--compare", help="earlier report to check for regressions against")
+    parser.add_argument("--tolerance", type=float, default=1.2,
+                        help="allowed slowdown/growth factor before a case counts as a regression")
+    args = parser.parse_args(argv)
+
+    options = {"block_size": args.block_size, "C": args.C, "tile_size": args.tile_size,
+               "simplify_tolerance": args.simplify, "max_triangles": args.max_triangles}
+    startup = measure_startup()
+    print(f"{'startup':>8} {'':>8}  import {startup['import_s']:.3f}s  warm-up {startup['warm_s']:.3f}s  "
+          f"process {startup['process_s']:.3f}s")
+    results = run_benchmarks(args.kinds, args.sizes, args.repeat, options)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "options": options,
+        "startup": startup,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance, startup)
+        for kind, size, metric, old, new in regressions:
+            print(f"REGRESSION {kind} {size}px {metric}: {old:.4g} -> {new:.4g}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
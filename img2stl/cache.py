@@ -0,0 +1,125 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+def mesh_suffix(mesh_path):
+    # "mesh.stl", "mesh.ply", ... after the output's extension
+    return "mesh" + (os.path.splitext(mesh_path)[1].lower() or ".stl")
+
+
+class ResultCache:
+    # On-disk cache for the stages of process_image_to_stl. Every entry is a
+    # single file named after a hash of the image content and the parameters
+    # that produced it, so the binary mask, the polygon set and the final
+    # mesh are cached separately: changing only the extrusion height reuses
+    # the cached polygons. Reading an entry refreshes its mtime, and the
+    # least recently used entries are deleted once the directory grows past
+    # max_bytes.
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def image_digest(image_path):
+        digest = hashlib.sha256()
+        with open(image_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, f"{key}.{suffix}")
+
+    def _lookup(self, key, suffix):
+        path = self._path(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _store(self, key, suffix, write):
+        # Write to a temporary file and rename it into place, so concurrent
+        # workers never see a half-written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, self._path(key, suffix))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def get_mask(self, key):
+        path = self._lookup(key, "mask.npy")
+        if path is None:
+            return None
+        return np.load(path)
+
+    def put_mask(self, key, binary):
+        self._store(key, "mask.npy", lambda f: np.save(f, binary))
+
+    def get_polygons(self, key):
+        from shapely import wkb
+
+        path = self._lookup(key, "polygons.wkb")
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return wkb.loads(f.read())
+
+    def put_polygons(self, key, polygon):
+        from shapely import wkb
+
+        self._store(key, "polygons.wkb", lambda f: f.write(wkb.dumps(polygon)))
+
+    def get_mesh(self, key, stl_path):
+        # Copies the cached mesh to stl_path; returns False on a miss. Each
+        # output format (by extension) is cached separately.
+        path = self._lookup(key, mesh_suffix(stl_path))
+        if path is None:
+            return False
+        shutil.copyfile(path, stl_path)
+        return True
+
+    def put_mesh(self, key, stl_path):
+        def write(f):
+            with open(stl_path, "rb") as src:
+                shutil.copyfileobj(src, f)
+        self._store(key, mesh_suffix(stl_path), write)
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,194 @@
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from .stl import StlWriter, discard_output, finish_output, merge_vertices, open_output
+
+
+# One binary PLY face record: vertex count (always 3) and indices.
+PLY_FACE_DTYPE = np.dtype([("n", "u1"), ("vertices", "<i4", (3,))])
+
+# Rows formatted per chunk by the text formats
+TEXT_CHUNK_ROWS = 1 << 16
+
+
+class IndexedMeshWriter:
+    # Base for formats that store a vertex table and faces indexing into
+    # it. Meshes arrive one piece at a time, like with StlWriter, and are
+    # spooled to temporary files as float32 vertices and int64 faces. On
+    # close the pieces are joined into one vertex/face structure and
+    # written out. With merge=True, vertices with identical coordinates in
+    # different pieces (e.g. the shared rows of relief bands) become one
+    # vertex, so the output is watertight by topology and not just by
+    # geometry. Leaving the with block by an exception aborts instead:
+    # nothing is written out, and a path target is left untouched (see
+    # stl.open_output).
+
+    def __init__(self, target, merge=True):
+        self.target = target
+        self.file, self._tmp_path = open_output(target)
+        self._owns_file = self._tmp_path is not None
+        self.merge = merge
+        self.count = 0
+        self.vertex_count = 0
+        self._vertices = tempfile.TemporaryFile()
+        self._faces = tempfile.TemporaryFile()
+
+    def write(self, vertices, faces):
+        if len(faces) == 0:
+            return
+        self._vertices.write(memoryview(np.ascontiguousarray(vertices, dtype="<f4")).cast("B"))
+        self._faces.write(memoryview(np.ascontiguousarray(faces + self.vertex_count, dtype="<i8")).cast("B"))
+        self.vertex_count += len(vertices)
+        self.count += len(faces)
+
+    def _spooled(self, spool, dtype, columns):
+        spool.flush()
+        if spool.tell() == 0:
+            return np.empty((0, columns), dtype=dtype)
+        return np.memmap(spool, dtype=dtype, mode="r").reshape(-1, columns)
+
+    def mesh(self):
+        vertices = self._spooled(self._vertices, "<f4", 3)
+        faces = self._spooled(self._faces, "<i8", 3)
+        if self.merge:
+            vertices, faces = merge_vertices(vertices, faces)
+        return vertices, faces
+
+    def write_mesh(self, vertices, faces):
+        raise NotImplementedError
+
+    def close(self):
+        try:
+            vertices, faces = self.mesh()
+            self.vertex_count = len(vertices)
+            self.write_mesh(vertices, faces)
+            del vertices, faces
+        except BaseException:
+            self.abort()
+            raise
+        self._vertices.close()
+        self._faces.close()
+        if self._owns_file:
+            finish_output(self.file, self._tmp_path, self.target)
+
+    def abort(self):
+        self._vertices.close()
+        self._faces.close()
+        if self._owns_file:
+            discard_output(self.file, self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def format_rows(fmt, rows):
+    # Text of `fmt` applied to each row, formatted by one % operation per
+    # chunk instead of one per row.
+    for start in range(0, len(rows), TEXT_CHUNK_ROWS):
+        chunk = rows[start:start + TEXT_CHUNK_ROWS]
+        yield (fmt * len(chunk)) % tuple(chunk.ravel().tolist())
+
+
+class PlyWriter(IndexedMeshWriter):
+    # Binary little-endian PLY: 12 bytes per vertex and 13 per face.
+
+    def write_mesh(self, vertices, faces):
+        header = ("ply\n"
+                  "format binary_little_endian 1.0\n"
+                  "comment img2stl\n"
+                  f"element vertex {len(vertices)}\n"
+                  "property float x\n"
+                  "property float y\n"
+                  "property float z\n"
+                  f"element face {len(faces)}\n"
+                  "property list uchar int vertex_indices\n"
+                  "end_header\n")
+        self.file.write(header.encode("ascii"))
+        self.file.write(memoryview(np.ascontiguousarray(vertices, dtype="<f4")).cast("B"))
+        records = np.empty(min(len(faces), TEXT_CHUNK_ROWS), dtype=PLY_FACE_DTYPE)
+        records["n"] = 3
+        for start in range(0, len(faces), TEXT_CHUNK_ROWS):
+            chunk = records[:len(faces[start:start + TEXT_CHUNK_ROWS])]
+            chunk["vertices"] = faces[start:start + TEXT_CHUNK_ROWS]
+            self.file.write(memoryview(chunk).cast("B"))
+
+
+class ObjWriter(IndexedMeshWriter):
+    # Wavefront OBJ with 1-based face indices.
+
+    def write_mesh(self, vertices, faces):
+        self.file.write(b"# img2stl\n")
+        for text in format_rows("v %.9g %.9g %.9g\n", vertices):
+            self.file.write(text.encode("ascii"))
+        for text in format_rows("f %d %d %d\n", faces + 1):
+            self.file.write(text.encode("ascii"))
+
+
+THREEMF_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+    '</Types>\n')
+
+THREEMF_RELS = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Target="/3D/3dmodel.model" Id="rel0" '
+    'Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+    '</Relationships>\n')
+
+
+class ThreeMfWriter(IndexedMeshWriter):
+    # 3MF package (a zip of XML parts) holding the mesh as one object, in
+    # millimetres. The model part is deflated as it is written, so its
+    # text never exists in memory as a whole.
+
+    def write_mesh(self, vertices, faces):
+        with zipfile.ZipFile(self.file, "w", zipfile.ZIP_DEFLATED) as package:
+            package.writestr("[Content_Types].xml", THREEMF_CONTENT_TYPES)
+            package.writestr("_rels/.rels", THREEMF_RELS)
+            with package.open("3D/3dmodel.model", "w", force_zip64=True) as model:
+                model.write(b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                            b'<model unit="millimeter" xml:lang="en-US" '
+                            b'xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">'
+                            b'<resources><object id="1" type="model"><mesh><vertices>')
+                for text in format_rows('<vertex x="%.9g" y="%.9g" z="%.9g"/>', vertices):
+                    model.write(text.encode("ascii"))
+                model.write(b"</vertices><triangles>")
+                for text in format_rows('<triangle v1="%d" v2="%d" v3="%d"/>', faces):
+                    model.write(text.encode("ascii"))
+                model.write(b'</triangles></mesh></object></resources>'
+                            b'<build><item objectid="1"/></build></model>\n')
+
+
+# Mesh writers by file extension; all share StlWriter's write/close/count
+# interface.
+MESH_WRITERS = {
+    ".stl": StlWriter,
+    ".ply": PlyWriter,
+    ".obj": ObjWriter,
+    ".3mf": ThreeMfWriter,
+}
+
+
+def mesh_writer(target, fmt=None):
+    # Writer for target, a path or a file object. The format is fmt (an
+    # extension such as ".ply"), else the extension of the path. File
+    # objects and paths without an extension get STL.
+    if fmt is None:
+        fmt = os.path.splitext(target)[1] if isinstance(target, (str, os.PathLike)) else ""
+    fmt = fmt or ".stl"
+    fmt = fmt.lower() if fmt.startswith(".") else "." + fmt.lower()
+    if fmt not in MESH_WRITERS:
+        raise ValueError(f"Unsupported mesh format {fmt!r}, expected one of {', '.join(MESH_WRITERS)}")
+    return MESH_WRITERS[fmt](target)
@@ -0,0 +1,230 @@
+import numpy as np
+
+from .export import mesh_writer
+from .geometry import polygon_parts, separate_touching_rings
+from .instrument import StageTimer
+
+
+# Runs of polygons per extrusion worker
+CHUNKS_PER_WORKER = 4
+
+
+def triangulate_polygon(poly):
+    import triangle
+    from shapely.geometry import Polygon
+    from shapely.geometry.polygon import orient
+
+    # Constrained Delaunay triangulation of one polygon's cap. Returns the
+    # 2D vertices, the boundary segments as vertex index pairs (following
+    # the ring directions) and the triangles.
+    poly = orient(poly, 1.0)  # exterior counter-clockwise, holes clockwise
+    rings = [poly.exterior] + list(poly.interiors)
+
+    coords = []
+    segments = []
+    holes = []
+    offset = 0
+    for k, ring in enumerate(rings):
+        points = np.asarray(ring.coords)[:-1]
+        idx = np.arange(offset, offset + len(points))
+        coords.append(points)
+        segments.append(np.column_stack((idx, np.roll(idx, -1))))
+        if k > 0:
+            holes.append(Polygon(ring).representative_point().coords[0])
+        offset += len(points)
+
+    # Valid polygons may still have rings touching at a vertex (unless they
+    # went through separate_touching_rings). Triangle cannot cope with
+    # duplicate input vertices, so merge them and point the segments at the
+    # shared vertex.
+    vertices, inverse = np.unique(np.concatenate(coords), axis=0, return_inverse=True)
+    segments = inverse.reshape(-1)[np.concatenate(segments)]
+
+    tri_input = {"vertices": vertices, "segments": segments}
+    if holes:
+        tri_input["holes"] = np.array(holes)
+    result = triangle.triangulate(tri_input, "pQ")
+
+    vertices = result["vertices"]
+    faces = result["triangles"]
+    # Triangle emits counter-clockwise triangles; enforce it so the top cap
+    # always faces +z.
+    p = vertices[faces]
+    signed = ((p[:, 1, 0] - p[:, 0, 0]) * (p[:, 2, 1] - p[:, 0, 1])
+              - (p[:, 1, 1] - p[:, 0, 1]) * (p[:, 2, 0] - p[:, 0, 0]))
+    faces[signed < 0] = faces[signed < 0][:, ::-1]
+    return vertices, tri_input["segments"], faces
+
+
+def extrude_polygon(poly, height=10):
+    # Bottom cap at z=0, top cap at z=height and the side walls share one
+    # vertex array: wall quads are built from the ring segments by index
+    # arithmetic instead of per-edge path objects.
+    vertices_2d, segments, caps = triangulate_polygon(separate_touching_rings(poly))
+    n = len(vertices_2d)
+
+    vertices = np.empty((2 * n, 3))
+    vertices[:n, :2] = vertices_2d
+    vertices[:n, 2] = 0
+    vertices[n:, :2] = vertices_2d
+    vertices[n:, 2] = height
+
+    i, j = segments[:, 0], segments[:, 1]
+    walls = np.concatenate((np.column_stack((i, j, j + n)),
+                            np.column_stack((i, j + n, i + n))))
+    faces = np.concatenate((caps[:, ::-1], caps + n, walls))
+    return vertices, faces
+
+
+def iter_extruded_polygons(polygon, height=10):
+    # Yields (vertices, faces) for one polygon at a time.
+    for poly in polygon_parts(separate_touching_rings(polygon)):
+        yield extrude_polygon(poly, height)
+
+
+def concatenate_meshes(meshes):
+    # One (vertices, faces) pair from several. The vertex and face offsets
+    # of every piece follow from the counts, so the output is allocated
+    # once and each piece is copied straight into place.
+    vertex_offsets = np.concatenate(([0], np.cumsum([len(v) for v, _ in meshes], dtype=np.int64)))
+    face_offsets = np.concatenate(([0], np.cumsum([len(f) for _, f in meshes], dtype=np.int64)))
+    vertices = np.empty((vertex_offsets[-1], 3))
+    faces = np.empty((face_offsets[-1], 3), dtype=np.int64)
+    for k, (v, f) in enumerate(meshes):
+        vertices[vertex_offsets[k]:vertex_offsets[k + 1]] = v
+        np.add(f, vertex_offsets[k], out=faces[face_offsets[k]:face_offsets[k + 1]])
+    return vertices, faces
+
+
+def extrude_chunk(polygons, height=10):
+    return concatenate_meshes([extrude_polygon(poly, height) for poly in polygons])
+
+
+def chunk_by_vertices(polygons, n_chunks):
+    # Splits polygons into up to n_chunks consecutive runs with about the
+    # same number of vertices each, since triangulation cost follows the
+    # vertex count rather than the number of polygons.
+    import shapely
+
+    cumulative = np.cumsum(shapely.get_num_coordinates(polygons))
+    targets = cumulative[-1] * np.arange(1, n_chunks) / n_chunks
+    cuts = np.unique(np.searchsorted(cumulative, targets, side="right"))
+    bounds = [0] + [c for c in cuts.tolist() if 0 < c < len(polygons)] + [len(polygons)]
+    return [polygons[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def extrude_chunk_shared(polygons, height=10):
+    # extrude_chunk for a worker process. The mesh goes back to the parent
+    # in shared memory, so only the paths and shapes are pickled; the
+    # parent owns (and closes) both arrays.
+    from .shared import SharedArray
+
+    vertices, faces = extrude_chunk(polygons, height)
+    return SharedArray.copy_of(vertices).transfer(), SharedArray.copy_of(faces).transfer()
+
+
+# The extrusion pool of this process and its worker count, created on first
+# use and kept for later images
+_pool = None
+_pool_workers = None
+
+
+def extrusion_pool(workers):
+    global _pool, _pool_workers
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing.util import Finalize
+
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ProcessPoolExecutor(workers)
+        _pool_workers = workers
+        # Worker processes (e.g. of a batch) exit without running atexit
+        # hooks but wait for their children, so the pool is shut down by a
+        # multiprocessing finalizer, which runs before that wait. It has to
+        # run before the finalizers of the pool's own queues (priority 10).
+        Finalize(_pool, _pool.shutdown, exitpriority=100)
+    return _pool
+
+
+def iter_extruded_chunks(polygon, height=10, workers=None):
+    # Yields (vertices, faces) per run of polygons, in polygon order. With
+    # workers > 1 the runs are triangulated and extruded in that many
+    # processes (triangle holds the GIL, so threads would not help); there
+    # are a few runs per worker so that one slow run does not hold up the
+    # rest. Runs from workers are views of shared memory whose files are
+    # removed as soon as the next run is requested; the mapping stays valid
+    # as long as the views are referenced.
+    global _pool
+    from concurrent.futures.process import BrokenProcessPool
+
+    # Parts touching each other are separated here, rings of one polygon
+    # touching each other in extrude_polygon.
+    parts = polygon_parts(separate_touching_rings(polygon))
+    if not workers or workers <= 1 or len(parts) < 2:
+        for poly in parts:
+            yield extrude_polygon(poly, height)
+        return
+    chunks = chunk_by_vertices(parts, CHUNKS_PER_WORKER * workers)
+    pool = extrusion_pool(workers)
+    futures = [pool.submit(extrude_chunk_shared, chunk, height) for chunk in chunks]
+    try:
+        for future in futures:
+            vertices, faces = future.result()
+            with vertices, faces:
+                yield vertices.array, faces.array
+    except BrokenProcessPool:
+        # A worker died; the next call starts a fresh pool.
+        _pool = None
+        raise
+    finally:
+        # Runs that were not consumed (an error, or the caller stopped
+        # early) still own their shared files.
+        for future in futures:
+            if future.cancel():
+                continue
+            try:
+                for shared in future.result():
+                    shared.close()
+            except Exception:
+                pass
+
+
+def extrude_polygons(polygon, height=10, workers=None):
+    # With workers the runs stay in shared memory until concatenate_meshes
+    # copies them into the one preallocated output.
+    meshes = list(iter_extruded_chunks(polygon, height, workers))
+    if not meshes:
+        return np.empty((0, 3)), np.empty((0, 3), dtype=np.int64)
+    return concatenate_meshes(meshes)
+
+
+def shapely_to_trimesh(polygon, height=10):
+    import trimesh
+
+    vertices, faces = extrude_polygons(polygon, height)
+    return trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
+
+
+def write_polygons_stl(polygon, output_stl, height=10, instrument=None, workers=None):
+    # Each polygon (or run of polygons, with workers > 1) is extruded and
+    # handed to the writer on its own, so no combined mesh (or trimesh's
+    # normal/adjacency caches) is ever built. The format follows the
+    # extension of output_stl (see export.py).
+    parts = polygon_parts(polygon)
+    extrude_timer = StageTimer()
+    export_timer = StageTimer()
+    meshes = iter_extruded_chunks(polygon, height, workers)
+    with mesh_writer(output_stl) as writer:
+        while True:
+            with extrude_timer:
+                mesh = next(meshes, None)
+            if mesh is None:
+                break
+            with export_timer:
+                writer.write(*mesh)
+    print(f"Mesh saved to: {output_stl} ({writer.count} facets)")
+
+    if instrument is not None:
+        instrument.record("extrude", extrude_timer.wall_s, extrude_timer.cpu_s, items=len(parts))
+        instrument.record("export", export_timer.wall_s, export_timer.cpu_s, items=writer.count)
@@ -0,0 +1,171 @@
+import numpy as np
+
+from .instrument import stage
+
+
+def iter_contour_children(hierarchy, parent):
+    # hierarchy rows are [next, previous, first_child, parent]
+    child = hierarchy[parent][2]
+    while child != -1:
+        yield child
+        child = hierarchy[child][0]
+
+
+def polygon_parts(polygon):
+    from shapely.geometry import MultiPolygon, Polygon
+
+    if isinstance(polygon, Polygon):
+        return [polygon]
+    elif isinstance(polygon, MultiPolygon):
+        return list(polygon.geoms)
+    else:
+        raise ValueError("Unsupported geometry type")
+
+
+# How far separate_touching_rings moves a vertex, relative to the largest
+# coordinate: far enough to survive rounding to float32 in the mesh files,
+# well below a pixel.
+TOUCH_NUDGE = 1e-5
+
+
+def separate_touching_rings(polygon):
+    # Valid geometry may still have rings that touch at a point: a hole
+    # touching the shell or another hole, or two parts of a MultiPolygon
+    # touching. Extruded, the wall edge through that point belongs to four
+    # faces, so the mesh is not watertight. Each ring through such a point
+    # gets its corner moved a tiny distance along the bisector of the side
+    # that no other ring enters, which opens a gap between the rings there.
+    # Within a polygon, a ring touching the middle of another ring's edge
+    # is first noded (by a union with itself) so the point is a vertex of
+    # both. Between parts that only matters at vertices, since walls
+    # meeting along a line still share no edge.
+    import shapely
+    from shapely.geometry import MultiPolygon, Polygon
+
+    if polygon.is_empty or shapely.is_simple(polygon.boundary):
+        return polygon
+    if isinstance(polygon, Polygon):
+        noded = shapely.union(polygon, polygon)
+        if isinstance(noded, Polygon):
+            polygon = noded
+
+    parts = polygon_parts(polygon)
+    rings = [np.asarray(ring.coords).reshape(-1, 2)[:-1] for part in parts
+             for ring in [part.exterior, *part.interiors]]
+    if not rings:
+        return polygon
+    points = np.concatenate(rings)
+    _, inverse, counts = np.unique(points, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    shared = np.flatnonzero(counts[inverse] > 1)
+    if len(shared) == 0:
+        return polygon
+
+    sizes = np.array([len(r) for r in rings])
+    starts = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    position = np.arange(len(points)) - starts
+    sizes = np.repeat(sizes, sizes)
+    previous = points[starts + (position - 1) % sizes]
+    following = points[starts + (position + 1) % sizes]
+    angle_in = np.arctan2(*(previous - points)[:, ::-1].T)
+    angle_out = np.arctan2(*(following - points)[:, ::-1].T)
+
+    distance = TOUCH_NUDGE * max(1.0, np.abs(points).max())
+    moved = points.copy()
+    for i in shared:
+        # The corner's side counter-clockwise from its outgoing edge to its
+        # incoming one, unless another ring's edge lies in it
+        width = (angle_in[i] - angle_out[i]) % (2 * np.pi)
+        others = shared[(inverse[shared] == inverse[i]) & (shared != i)]
+        relative = (np.concatenate((angle_in[others], angle_out[others])) - angle_out[i]) % (2 * np.pi)
+        bisector = angle_out[i] + width / 2
+        if np.any((relative > 0) & (relative < width)):
+            bisector += np.pi
+        moved[i] += distance * np.array([np.cos(bisector), np.sin(bisector)])
+
+    moved = np.split(moved, np.cumsum([len(r) for r in rings])[:-1])
+    separated = []
+    for part in parts:
+        shell, *holes = moved[:1 + len(part.interiors)]
+        moved = moved[1 + len(part.interiors):]
+        separated.append(Polygon(shell, holes))
+    if isinstance(polygon, Polygon):
+        return separated[0]
+    return MultiPolygon(separated)
+
+
+def union_overlapping(polygons):
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    from shapely.geometry import MultiPolygon, Polygon
+    from shapely.ops import unary_union
+    from shapely.strtree import STRtree
+
+    # Only polygons whose geometry actually meets another one need to go
+    # through unary_union. An STRtree finds the intersecting pairs, and each
+    # connected group of them is unioned on its own; isolated polygons are
+    # passed through untouched.
+    if len(polygons) == 0:
+        return MultiPolygon()
+    tree = STRtree(polygons)
+    left, right = tree.query(polygons, predicate="intersects")
+    adjacency = coo_matrix((np.ones(len(left), dtype=np.int8), (left, right)),
+                           shape=(len(polygons), len(polygons)))
+    n_groups, labels = connected_components(adjacency, directed=False)
+    print(f"Unioning {len(polygons)} polygons in {n_groups} independent groups.")
+
+    parts = []
+    order = np.argsort(labels, kind="stable")
+    splits = np.flatnonzero(np.diff(labels[order])) + 1
+    for group in np.split(order, splits):
+        if len(group) == 1:
+            merged = polygons[group[0]]
+        else:
+            merged = unary_union([polygons[i] for i in group])
+        if isinstance(merged, Polygon):
+            parts.append(merged)
+        elif hasattr(merged, "geoms"):
+            parts.extend(g for g in merged.geoms if isinstance(g, Polygon))
+    return MultiPolygon(parts)
+
+
+def contour_polygons(contours, hierarchy=None, offset=(0, 0)):
+    from shapely.geometry import Polygon
+
+    # With a RETR_CCOMP hierarchy, child contours become interior rings.
+    # offset shifts the contours, e.g. from tile to image coordinates.
+    if hierarchy is None:
+        hierarchy = np.full((len(contours), 4), -1, dtype=np.int32)
+    offset = np.asarray(offset)
+
+    polygons = []
+    for i, contour in enumerate(contours):
+        if hierarchy[i][3] != -1:
+            continue
+        shell = contour.reshape(-1, 2) + offset
+        if len(shell) < 3:
+            print(f"Contour {i} ignored due to insufficient points.")
+            continue
+        holes = [contours[j].reshape(-1, 2) + offset for j in iter_contour_children(hierarchy, i)]
+        poly = Polygon(shell, [h for h in holes if len(h) >= 3])
+        if not poly.is_valid:
+            poly = poly.buffer(0)
+        if poly.is_valid and poly.area > 0:
+            polygons.append(poly)
+    return polygons
+
+
+def contours_to_shapely_polygons(contours, hierarchy=None, instrument=None):
+    # Direct counterpart of svg_to_shapely_polygons: the contour arrays from
+    # cv2.findContours become polygons without an SVG write/parse in between.
+    with stage(instrument, "polygons") as rec:
+        polygons = contour_polygons(contours, hierarchy)
+        rec["items"] = len(polygons)
+    print(f"Number of polygons from contours: {len(polygons)}")
+    with stage(instrument, "union") as rec:
+        combined = union_overlapping(polygons)
+        rec["items"] = len(combined.geoms)
+    if combined.is_empty:
+        raise ValueError("No valid polygons found in image.")
+    print(f"Combined polygon area: {combined.area:.2f}")
+    return combined
@@ -0,0 +1,114 @@
+import contextlib
+import json
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_bytes():
+    # Peak resident set size of this process so far, or None if the
+    # platform does not report it.
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class JsonLinesSink:
+    # Appends one JSON object per stage record to a file. The file is opened
+    # per record, so several worker processes can share one metrics file.
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, record):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+class Instrumentation:
+    # Records wall time, CPU time, memory and item counts for each pipeline
+    # stage and hands every record to the sinks, which are callables taking
+    # the record dict (e.g. a JsonLinesSink, or list.append). Extra keyword
+    # arguments are added to every record, e.g. image=path.
+    #
+    # peak_rss_bytes is the process-wide peak at the end of the stage. With
+    # trace_memory=True, tracemalloc also reports the peak Python/NumPy
+    # allocation within each stage (at some cost in speed).
+
+    def __init__(self, sinks=(), trace_memory=False, **context):
+        self.sinks = list(sinks)
+        self.trace_memory = trace_memory
+        self.context = context
+        self.records = []
+
+    def record(self, name, wall_s, cpu_s, items=None, **fields):
+        # For stages measured by the caller, e.g. time accumulated over an
+        # interleaved loop.
+        record = {"stage": name, **self.context, **fields,
+                  "wall_s": wall_s, "cpu_s": cpu_s, "items": items,
+                  "peak_rss_bytes": peak_rss_bytes()}
+        self.records.append(record)
+        for sink in self.sinks:
+            sink(record)
+        return record
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        # Yields a dict; set "items" (or any other key) on it inside the
+        # block and it ends up in the record.
+        extra = {"items": None}
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield extra
+        except BaseException:
+            extra["error"] = True
+            raise
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            if self.trace_memory:
+                extra["tracemalloc_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+            items = extra.pop("items")
+            self.record(name, wall, cpu, items, **fields, **extra)
+
+
+def stage(instrument, name, **fields):
+    # Pipeline functions take instrument=None; this keeps their code the
+    # same whether or not anyone is listening.
+    if instrument is None:
+        return contextlib.nullcontext({})
+    return instrument.stage(name, **fields)
+
+
+class StageTimer:
+    # Accumulates wall and CPU time over many short sections of one stage,
+    # e.g. the extrude and export halves of a streaming loop. Report the
+    # totals with Instrumentation.record.
+
+    def __init__(self):
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall_s += time.perf_counter() - self._wall
+        self.cpu_s += time.process_time() - self._cpu
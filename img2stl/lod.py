@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+
+from .stl import StlWriter, indexed_mesh, read_stl_triangles
+
+
+# Grid resolutions (cells along the longest side) of the preview levels,
+# coarsest first.
+LOD_LEVELS = (64, 256, 1024)
+
+
+def cluster_vertices(vertices, faces, cells):
+    # Vertex clustering decimation: the bounding box is cut into a grid with
+    # `cells` cells along its longest side, every vertex moves to the mean of
+    # the vertices in its cell, and triangles that collapse to an edge or a
+    # point are dropped. Duplicate corners need no merging beforehand; they
+    # always fall into the same cell.
+    if len(faces) == 0:
+        return vertices, faces
+    lo = vertices.min(axis=0)
+    extent = vertices.max(axis=0) - lo
+    size = max(extent.max() / cells, np.finfo(np.float32).tiny)
+    grid = np.floor((vertices - lo) / size).astype(np.int64)
+    dims = grid.max(axis=0) + 1
+    keys = (grid[:, 0] * dims[1] + grid[:, 1]) * dims[2] + grid[:, 2]
+    _, cluster = np.unique(keys, return_inverse=True)
+    cluster = cluster.reshape(-1)
+
+    counts = np.bincount(cluster)
+    clustered = np.column_stack([np.bincount(cluster, weights=vertices[:, k]) / counts for k in range(3)])
+    faces = cluster[faces]
+    a, b, c = faces[:, 0], faces[:, 1], faces[:, 2]
+    return clustered, faces[(a != b) & (b != c) & (a != c)]
+
+
+def lod_path(stl_path, cells):
+    root, ext = os.path.splitext(stl_path)
+    return f"{root}.lod{cells}{ext}"
+
+
+def build_lod(stl_path, cells):
+    # Decimated copy of stl_path, cached next to it and rebuilt only when
+    # the STL is newer than the cached copy.
+    path = lod_path(stl_path, cells)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(stl_path):
+        return path
+    vertices, faces = indexed_mesh(read_stl_triangles(stl_path))
+    vertices, faces = cluster_vertices(vertices.astype(np.float64), faces, cells)
+    with StlWriter(path) as writer:
+        writer.write(vertices, faces)
+    return path
+
+
+def facet_count(stl_path):
+    return len(read_stl_triangles(stl_path))
+
+
+def iter_lods(stl_path, levels=LOD_LEVELS):
+    # Paths of the preview meshes from coarsest to finest, then the STL
+    # itself. Each level is only built when the caller asks for it, and
+    # levels that would keep more than half of the facets are skipped.
+    full = facet_count(stl_path)
+    for cells in levels:
+        path = build_lod(stl_path, cells)
+        if facet_count(path) > full // 2:
+            break
+        yield path
+    yield stl_path
+
+
+def lod_within(stl_path, max_facets, levels=LOD_LEVELS):
+    # The finest level (possibly the STL itself) with at most max_facets
+    # triangles, or the coarsest one if none is that small.
+    best = None
+    for path in iter_lods(stl_path, levels):
+        if best is not None and facet_count(path) > max_facets:
+            break
+        best = path
+    return best
@@ -0,0 +1,198 @@
+import os
+
+from .extrude import write_polygons_stl
+from .geometry import contours_to_shapely_polygons
+from .instrument import stage
+from .raster import clean_binary, find_silhouette_contours, load_grayscale, threshold_image
+from .relief import relief_image_to_stl
+from .simplify import count_vertices, simplify_polygons
+from .svg import svg_to_shapely_polygons, write_contours_svg
+from .tiled import tiled_image_to_stl
+
+
+def image_to_svg_silhouette_adaptive(image_path, svg_path, block_size=140, C=0, threshold_method="mean",
+                                     open_size=0, close_size=0, min_area=0):
+    import cv2
+
+    img = load_grayscale(image_path)
+    binary = binary_mask(img, block_size, C, threshold_method, open_size, close_size, min_area)
+
+    cv2.imwrite("debug_binary.png", binary)  # Save binary for inspection
+    print("Saved binary threshold image as debug_binary.png")
+
+    contours, hierarchy = find_silhouette_contours(binary)
+
+    height, width = binary.shape
+    write_contours_svg(contours, svg_path, width, height, hierarchy)
+
+    if not os.path.exists(svg_path):
+        raise FileNotFoundError("SVG file was not created successfully.")
+
+
+def convert_svg_to_3d(svg_file, output_stl, height=10, instrument=None, extrude_workers=None):
+    polygon = svg_to_shapely_polygons(svg_file, instrument=instrument)
+    write_polygons_stl(polygon, output_stl, height, instrument, extrude_workers)
+
+
+def binary_mask(img, block_size=140, C=0, threshold_method="mean", open_size=0, close_size=0, min_area=0,
+                instrument=None, threshold_backend="opencv"):
+    # Threshold and optional cleanup of a grayscale image (255 = silhouette)
+    with stage(instrument, "threshold") as rec:
+        binary = threshold_image(img, block_size, C, threshold_method, threshold_backend)
+        rec["items"] = binary.size
+    if open_size or close_size or min_area:
+        with stage(instrument, "cleanup") as rec:
+            binary = clean_binary(binary, open_size, close_size, min_area)
+            rec["items"] = binary.size
+    return binary
+
+
+def mask_to_polygons(binary, svg_path=None, instrument=None):
+    with stage(instrument, "contour") as rec:
+        contours, hierarchy = find_silhouette_contours(binary)
+        rec["items"] = len(contours)
+
+    if svg_path is not None:
+        image_height, image_width = binary.shape
+        with stage(instrument, "svg_write") as rec:
+            write_contours_svg(contours, svg_path, image_width, image_height, hierarchy)
+            rec["items"] = len(contours)
+
+    return contours_to_shapely_polygons(contours, hierarchy, instrument)
+
+
+def array_to_polygons(img, svg_path=None, block_size=140, C=0, instrument=None, threshold_method="mean",
+                      open_size=0, close_size=0, min_area=0, threshold_backend="opencv"):
+    # Silhouette polygons of a grayscale image that is already in memory
+    binary = binary_mask(img, block_size, C, threshold_method, open_size, close_size, min_area, instrument,
+                         threshold_backend)
+    return mask_to_polygons(binary, svg_path, instrument)
+
+
+def simplify_outlines(polygon, simplify_tolerance=None, max_triangles=None, instrument=None):
+    if not simplify_tolerance and max_triangles is None:
+        return polygon
+    with stage(instrument, "simplify") as rec:
+        polygon = simplify_polygons(polygon, simplify_tolerance, max_triangles=max_triangles)
+        rec["items"] = count_vertices(polygon)
+    if polygon.is_empty:
+        raise ValueError("No valid polygons left after simplification.")
+    return polygon
+
+
+def array_to_stl(img, stl_target, block_size=140, C=0, height=10, simplify_tolerance=None,
+                 max_triangles=None, instrument=None, threshold_method="mean", open_size=0, close_size=0,
+                 min_area=0, extrude_workers=None, threshold_backend="opencv"):
+    # The in-memory part of process_image_to_stl, for a grayscale image
+    # that was loaded or decoded elsewhere. stl_target is a path or a
+    # seekable file object.
+    polygon = array_to_polygons(img, None, block_size, C, instrument, threshold_method, open_size, close_size,
+                                min_area, threshold_backend)
+    polygon = simplify_outlines(polygon, simplify_tolerance, max_triangles, instrument)
+    write_polygons_stl(polygon, stl_target, height, instrument, extrude_workers)
+
+
+def image_to_polygons(image_path, svg_path=None, block_size=140, C=0, cache=None, digest=None,
+                      instrument=None, threshold_method="mean", open_size=0, close_size=0, min_area=0,
+                      threshold_backend="opencv"):
+    mask_key = polygons_key = None
+    if cache is not None:
+        params = (block_size, C, threshold_method, threshold_backend, open_size, close_size, min_area)
+        mask_key = cache.key(digest, "mask", *params)
+        polygons_key = cache.key(digest, "polygons", *params)
+        # The SVG side output needs the contours, so only skip contour
+        # extraction when no SVG is wanted.
+        if svg_path is None:
+            polygon = cache.get_polygons(polygons_key)
+            if polygon is not None:
+                print("Using cached polygons.")
+                return polygon
+
+    print("Starting image to contour extraction...")
+    binary = cache.get_mask(mask_key) if cache is not None else None
+    if binary is None:
+        with stage(instrument, "load") as rec:
+            img = load_grayscale(image_path)
+            rec["items"] = img.size
+        binary = binary_mask(img, block_size, C, threshold_method, open_size, close_size, min_area, instrument,
+                             threshold_backend)
+        if cache is not None:
+            cache.put_mask(mask_key, binary)
+    else:
+        print("Using cached binary mask.")
+
+    polygon = mask_to_polygons(binary, svg_path, instrument)
+    if cache is not None:
+        cache.put_polygons(polygons_key, polygon)
+    return polygon
+
+
+def process_image_to_stl(image_path, stl_path=None, svg_path=None, block_size=140, C=0, height=10,
+                         cache=None, tile_size=None, instrument=None, simplify_tolerance=None,
+                         max_triangles=None, relief=False, relief_levels=None, relief_max_size=1024,
+                         threshold_method="mean", open_size=0, close_size=0, min_area=0, extrude_workers=None,
+                         threshold_backend="opencv"):
+    # Contours go straight from cv2.findContours into shapely and the
+    # extruder. Pass svg_path to also write the silhouette as an SVG, and a
+    # cache.ResultCache to reuse the mask, polygons and mesh of earlier runs.
+    # With tile_size set, the image is processed in tiles (see tiled.py).
+    # An instrument.Instrumentation receives per-stage timing records.
+    # simplify_tolerance and max_triangles reduce outline detail before
+    # extrusion (see simplify.py). relief=True maps intensity to height
+    # instead of extruding a silhouette (see relief.py); block_size and C
+    # do not apply there. threshold_method selects mean, gaussian, otsu or
+    # sauvola thresholding and threshold_backend its implementation (see
+    # threshold.py). open_size, close_size and
+    # min_area clean up the mask before contouring (see
+    # raster.clean_binary). extrude_workers > 1 extrudes the polygons in
+    # that many processes (see extrude.iter_extruded_chunks).
+    if stl_path is None:
+        base_dir = os.path.dirname(os.path.abspath(image_path))
+        stl_path = os.path.join(base_dir, "output.stl")
+
+    digest = mesh_key = None
+    if cache is not None:
+        digest = cache.image_digest(image_path)
+        mesh_key = cache.key(digest, "mesh", block_size, C, height, simplify_tolerance, max_triangles,
+                             tile_size, relief, relief_levels, relief_max_size, threshold_method,
+                             threshold_backend, open_size, close_size, min_area)
+        if svg_path is None and cache.get_mesh(mesh_key, stl_path):
+            print(f"Mesh restored from cache: {stl_path}")
+            return stl_path
+
+    if relief:
+        if svg_path is not None or tile_size is not None:
+            raise ValueError("SVG output and tiling are not supported in relief mode")
+        relief_image_to_stl(image_path, stl_path, height, levels=relief_levels, max_size=relief_max_size,
+                            instrument=instrument)
+    elif tile_size is not None:
+        if svg_path is not None:
+            raise ValueError("SVG output is not supported in tiled mode")
+        if max_triangles is not None:
+            raise ValueError("A triangle budget is not supported in tiled mode")
+        if threshold_method == "otsu":
+            raise ValueError("Otsu thresholding is not supported in tiled mode")
+        if min_area:
+            raise ValueError("Component area filtering is not supported in tiled mode")
+        tiled_image_to_stl(image_path, stl_path, tile_size, block_size, C, height, instrument,
+                           simplify_tolerance, threshold_method, open_size, close_size, threshold_backend)
+    else:
+        polygon = image_to_polygons(image_path, svg_path, block_size, C, cache, digest, instrument,
+                                    threshold_method, open_size, close_size, min_area, threshold_backend)
+        polygon = simplify_outlines(polygon, simplify_tolerance, max_triangles, instrument)
+        print("Starting contour to 3D STL conversion...")
+        write_polygons_stl(polygon, stl_path, height, instrument, extrude_workers)
+    if cache is not None:
+        cache.put_mesh(mesh_key, stl_path)
+
+    return stl_path
+
+
+def warm_up():
+    # Imports every heavy dependency a conversion needs, e.g. once per
+    # worker process before the first job arrives.
+    import cv2  # noqa: F401
+    import scipy.sparse.csgraph  # noqa: F401
+    import shapely.geometry  # noqa: F401
+    import shapely.ops  # noqa: F401
+    import triangle  # noqa: F401
@@ -0,0 +1,85 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+from .raster import load_grayscale, normalize_block_size
+
+
+class ThresholdPreview:
+    # Recomputes the adaptive threshold for interactive tuning without
+    # redoing work that does not depend on the changed parameter. The image
+    # is decoded once and shrunk to a proxy of at most proxy_size pixels per
+    # side. For every block size the difference between each pixel and its
+    # local box-filtered mean is kept, so moving C only costs one compare,
+    # and moving block_size only one box filter. Results match
+    # cv2.adaptiveThreshold(..., ADAPTIVE_THRESH_MEAN_C, THRESH_BINARY_INV)
+    # exactly at full resolution.
+
+    def __init__(self, img, proxy_size=1024, cache_size=8):
+        import cv2
+
+        self.img = img
+        self.scale = min(1.0, proxy_size / max(img.shape))
+        if self.scale < 1:
+            size = (max(1, round(img.shape[1] * self.scale)), max(1, round(img.shape[0] * self.scale)))
+            self.proxy = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        else:
+            self.proxy = img
+        self.cache_size = cache_size
+        self._diffs = OrderedDict()
+
+    @classmethod
+    def from_file(cls, image_path, **kwargs):
+        return cls(load_grayscale(image_path), **kwargs)
+
+    def proxy_block_size(self, block_size):
+        # The same neighbourhood measured in proxy pixels
+        return normalize_block_size(int(round(normalize_block_size(block_size) * self.scale)))
+
+    def _diff(self, block_size, full):
+        import cv2
+
+        key = (full, block_size)
+        diff = self._diffs.get(key)
+        if diff is not None:
+            self._diffs.move_to_end(key)
+            return diff
+
+        src = self.img if full else self.proxy
+        # Same mean as cv2.adaptiveThreshold: a normalized box filter,
+        # rounded back to uint8, with replicated borders.
+        mean = cv2.boxFilter(src, -1, (block_size, block_size), normalize=True,
+                             borderType=cv2.BORDER_REPLICATE | cv2.BORDER_ISOLATED)
+        diff = cv2.subtract(src, mean, dtype=cv2.CV_16S)
+
+        self._diffs[key] = diff
+        while len(self._diffs) > self.cache_size:
+            self._diffs.popitem(last=False)
+        return diff
+
+    def threshold(self, block_size=140, C=0, full=False):
+        # Binary mask (255 = silhouette) of the proxy, or of the full image
+        # with full=True.
+        import cv2
+
+        block_size = normalize_block_size(block_size) if full else self.proxy_block_size(block_size)
+        diff = self._diff(block_size, full)
+        return cv2.compare(diff, -math.floor(C), cv2.CMP_LE)
+
+    def display(self, block_size=140, C=0, full=False):
+        # Mask at proxy resolution for showing on screen. With full=True it
+        # is thresholded at full resolution first and then shrunk, which
+        # shows thin features the proxy itself loses.
+        import cv2
+
+        binary = self.threshold(block_size, C, full)
+        if full and binary.shape != self.proxy.shape:
+            binary = cv2.resize(binary, self.proxy.shape[::-1], interpolation=cv2.INTER_AREA)
+        return binary
+
+
+def pgm_bytes(gray):
+    # Binary PGM of an 8-bit image, which Tk's PhotoImage reads natively.
+    height, width = gray.shape
+    return f"P5 {width} {height} 255\n".encode() + np.ascontiguousarray(gray, dtype=np.uint8).tobytes()
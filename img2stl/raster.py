@@ -0,0 +1,99 @@
+import numpy as np
+
+
+def load_grayscale(image_path):
+    import cv2
+
+    print(f"Loading image: {image_path}")
+    # .npy arrays (as accepted by the batch converter) are not something
+    # cv2.imread can decode; they have to be 2D uint8 grayscale already.
+    if image_path.lower().endswith(".npy"):
+        img = np.load(image_path)
+        if img.ndim != 2 or img.dtype != np.uint8:
+            raise ValueError(".npy input must be a 2D uint8 array")
+        return img
+    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError("Failed to load image")
+    return img
+
+
+def normalize_block_size(block_size):
+    # Ensure block_size is odd and >=3
+    if block_size % 2 == 0:
+        block_size += 1
+    if block_size < 3:
+        block_size = 3
+    return block_size
+
+
+def threshold_image(img, block_size=140, C=0, method="mean", backend="opencv"):
+    from .threshold import adaptive_threshold
+
+    # method is one of threshold.THRESHOLD_METHODS; backend picks the
+    # OpenCV or NumPy implementation, or with "auto" whichever is faster
+    # for images of this size (see threshold.adaptive_threshold).
+    block_size = normalize_block_size(block_size)
+    print(f"Applying {method} threshold with block_size={block_size}, C={C}...")
+    return adaptive_threshold(img, block_size, C, method, backend)
+
+
+def remove_small_components(binary, min_area, value=255):
+    import cv2
+
+    # Connected components of `value` pixels (255: blobs, 0: holes) smaller
+    # than min_area are flipped to the other value. One labelling pass and
+    # a lookup table do it for all of them at once. Blobs are 8-connected
+    # and holes 4-connected, as cv2.findContours sees them. Background that
+    # reaches the image border is outside space rather than a hole, so it
+    # is never filled however small. Returns the new mask and the number of
+    # components removed.
+    mask = binary if value == 255 else cv2.bitwise_not(binary)
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8 if value == 255 else 4)
+    small = stats[:, cv2.CC_STAT_AREA] < min_area
+    small[0] = False  # label 0 is the rest of the image
+    if value == 0:
+        left, top = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+        right = left + stats[:, cv2.CC_STAT_WIDTH]
+        bottom = top + stats[:, cv2.CC_STAT_HEIGHT]
+        small &= (left > 0) & (top > 0) & (right < mask.shape[1]) & (bottom < mask.shape[0])
+    if not small.any():
+        return binary, 0
+    lut = np.full(n, value, dtype=np.uint8)
+    lut[0] = 255 - value
+    lut[small] = 255 - value
+    return lut[labels], int(small.sum())
+
+
+def clean_binary(binary, open_size=0, close_size=0, min_area=0):
+    import cv2
+
+    # Cleanup between thresholding and contouring. Opening removes specks
+    # and bridges thinner than open_size pixels, closing fills pinholes and
+    # gaps thinner than close_size. Blobs and holes smaller than min_area
+    # pixels are then dropped, so they never become contours or polygons.
+    if open_size > 1:
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (open_size, open_size))
+        binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+    if close_size > 1:
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (close_size, close_size))
+        binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+    if min_area > 0:
+        binary, blobs = remove_small_components(binary, min_area, 255)
+        binary, holes = remove_small_components(binary, min_area, 0)
+        print(f"Removed {blobs} blobs and filled {holes} holes smaller than {min_area} pixels.")
+    return binary
+
+
+def find_silhouette_contours(binary):
+    import cv2
+
+    # RETR_CCOMP gives a two-level hierarchy: outer boundaries at the top
+    # level, the holes inside them as their children.
+    contours, hierarchy = cv2.findContours(binary, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    print(f"Found {len(contours)} contours.")
+    if hierarchy is None:
+        hierarchy = np.empty((0, 4), dtype=np.int32)
+    else:
+        hierarchy = hierarchy.reshape(-1, 4)
+    return contours, hierarchy
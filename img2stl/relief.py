@@ -0,0 +1,303 @@
+import numpy as np
+
+from .export import mesh_writer
+from .geometry import TOUCH_NUDGE, contour_polygons, union_overlapping
+from .instrument import StageTimer, stage
+from .raster import find_silhouette_contours
+from .tiled import open_image_source
+
+
+def relief_heights(img, height=10, base_height=1, max_size=None, invert=True):
+    # Height of every grid vertex: base_height for white, height for black
+    # (or the other way round with invert=False). Images larger than
+    # max_size pixels per side are shrunk first; step is the grid spacing
+    # in image pixels, so the mesh keeps the image's extent.
+    import cv2
+
+    step = 1.0
+    if max_size is not None and max(img.shape) > max_size:
+        step = max(img.shape) / max_size
+        size = (max(2, round(img.shape[1] / step)), max(2, round(img.shape[0] / step)))
+        img = cv2.resize(np.asarray(img), size, interpolation=cv2.INTER_AREA)
+    darkness = np.asarray(img, dtype=np.float32) / 255
+    if invert:
+        darkness = 1 - darkness
+    return base_height + darkness * (height - base_height), step
+
+
+def heightfield_band(z, r0, r1, step=1.0):
+    # Top surface of grid rows r0..r1 (inclusive): one vertex per grid
+    # point and two counter-clockwise triangles per cell, all by index
+    # arithmetic.
+    rows = z[r0:r1 + 1]
+    h, w = rows.shape
+    vertices = np.empty((h * w, 3))
+    vertices[:, 0] = np.tile(np.arange(w) * step, h)
+    vertices[:, 1] = np.repeat((r0 + np.arange(h)) * step, w)
+    vertices[:, 2] = rows.ravel()
+
+    idx = np.arange(h * w).reshape(h, w)
+    a, b = idx[:-1, :-1].ravel(), idx[:-1, 1:].ravel()
+    c, d = idx[1:, 1:].ravel(), idx[1:, :-1].ravel()
+    faces = np.concatenate((np.column_stack((a, b, c)), np.column_stack((a, c, d))))
+    return vertices, faces
+
+
+def heightfield_sides(z, step=1.0):
+    # Side walls and bottom of the heightfield. The boundary grid points,
+    # counter-clockwise, are repeated at z=0; the bottom is a fan around
+    # its centre, which never produces degenerate triangles on the
+    # straight edges.
+    h, w = z.shape
+    rows = np.concatenate((np.zeros(w - 1, int), np.arange(h - 1), np.full(w - 1, h - 1),
+                           np.arange(h - 1, 0, -1)))
+    cols = np.concatenate((np.arange(w - 1), np.full(h - 1, w - 1), np.arange(w - 1, 0, -1),
+                           np.zeros(h - 1, int)))
+    n = len(rows)
+
+    vertices = np.empty((2 * n + 1, 3))
+    vertices[:n, 0] = vertices[n:2 * n, 0] = cols * step
+    vertices[:n, 1] = vertices[n:2 * n, 1] = rows * step
+    vertices[:n, 2] = 0
+    vertices[n:2 * n, 2] = z[rows, cols]
+    vertices[2 * n] = ((w - 1) * step / 2, (h - 1) * step / 2, 0)
+
+    i = np.arange(n)
+    j = (i + 1) % n
+    walls = np.concatenate((np.column_stack((i, j, j + n)), np.column_stack((i, j + n, i + n))))
+    bottom = np.column_stack((np.full(n, 2 * n), j, i))
+    return vertices, np.concatenate((walls, bottom))
+
+
+def write_heightfield_stl(z, stl_path, step=1.0, band_rows=256, instrument=None):
+    # The top surface is generated and streamed in bands of rows, so only
+    # one band's vertices and faces exist at a time. Neighbouring bands
+    # share a row of grid points, which repeat the same coordinates, so
+    # the mesh is watertight.
+    mesh_timer = StageTimer()
+    export_timer = StageTimer()
+    with mesh_writer(stl_path) as writer:
+        for r0 in range(0, z.shape[0] - 1, band_rows):
+            with mesh_timer:
+                vertices, faces = heightfield_band(z, r0, min(r0 + band_rows, z.shape[0] - 1), step)
+            with export_timer:
+                writer.write(vertices, faces)
+        with mesh_timer:
+            vertices, faces = heightfield_sides(z, step)
+        with export_timer:
+            writer.write(vertices, faces)
+    print(f"Mesh saved to: {stl_path} ({writer.count} facets)")
+
+    if instrument is not None:
+        instrument.record("heightfield", mesh_timer.wall_s, mesh_timer.cpu_s, items=z.size)
+        instrument.record("export", export_timer.wall_s, export_timer.cpu_s, items=writer.count)
+
+
+def touching_points(polygon):
+    # Points where rings of polygon touch: a hole touching the shell or
+    # another hole, or two parts touching, at a vertex or the middle of an
+    # edge (noded by a union with itself, so it becomes a vertex of both).
+    import shapely
+
+    if polygon.is_empty or shapely.is_simple(polygon.boundary):
+        return np.empty((0, 2))
+    noded = shapely.union(polygon, polygon)
+    coords, ring_idx = shapely.get_coordinates(shapely.get_rings(shapely.get_parts(noded)), return_index=True)
+    last = np.r_[ring_idx[1:] != ring_idx[:-1], True]
+    points, counts = np.unique(coords[~last], axis=0, return_counts=True)
+    return points[counts > 1]
+
+
+def terrace_faces(regions):
+    # Faces of the arrangement of the regions' boundaries, and for each the
+    # number of regions that contain it. All boundaries are noded together,
+    # so a point where one boundary touches another is a vertex of both,
+    # and neighbouring faces share their edges exactly.
+    #
+    # A region whose rings touch at a point would give the walls through
+    # that point four faces on an edge. Instead of moving the rings apart,
+    # which can push one region out of the one below it, every region
+    # whose closure holds such a point (of any region) is grown by a tiny
+    # disc there. The regions stay nested, and the point is inside all of
+    # them. The disc is an octagon turned by half a side, so its corners
+    # do not land on the pixel grid's horizontal, vertical or diagonal
+    # edges through the point. The overlays snap to a power-of-two grid
+    # far below the disc size, so a vertex that is (numerically) on an
+    # edge is always noded into it; otherwise the caps' triangulation
+    # could split an edge that the walls do not.
+    import shapely
+
+    regions = list(regions)
+    radius = TOUCH_NUDGE * max(np.abs(shapely.get_coordinates(regions)).max(), 1.0)
+    grid_size = 2.0 ** np.floor(np.log2(radius / 64))
+    points = np.concatenate([touching_points(region) for region in regions])
+    if len(points):
+        angles = (np.arange(8) + 0.5) * np.pi / 4
+        discs = shapely.polygons(points[:, None] + radius * np.column_stack((np.cos(angles), np.sin(angles))))
+        for i, region in enumerate(regions):
+            near = shapely.intersects_xy(region, points[:, 0], points[:, 1])
+            if near.any():
+                regions[i] = shapely.union_all([region, *discs[near]], grid_size=grid_size)
+    linework = shapely.union_all([shapely.boundary(region) for region in regions], grid_size=grid_size)
+    faces = shapely.get_parts(shapely.polygonize(shapely.get_parts(linework)))
+    points = shapely.get_coordinates(shapely.point_on_surface(faces))
+    counts = np.zeros(len(faces), dtype=np.int64)
+    for region in regions:
+        shapely.prepare(region)
+        counts += shapely.contains_xy(region, points[:, 0], points[:, 1])
+    return faces, counts
+
+
+def terrace_walls(faces, counts, z_levels):
+    # Side walls between faces at different heights; face i is at
+    # z_levels[counts[i]]. Every face edge, directed with the face on its
+    # left, is matched with the same edge reversed in the neighbouring
+    # face (or the ground, z_levels[0], if there is none), and the higher
+    # face gets a wall down to the lower one. The wall has a row of quads
+    # per level it passes, so its edges meet the walls and tops of every
+    # level in between.
+    import shapely
+
+    rings, face_idx = shapely.get_rings(shapely.orient_polygons(faces), return_index=True)
+    coords, ring_idx = shapely.get_coordinates(rings, return_index=True)
+    same_ring = ring_idx[1:] == ring_idx[:-1]
+    starts, ends = coords[:-1][same_ring], coords[1:][same_ring]
+    level = counts[face_idx[ring_idx[:-1][same_ring]]]
+
+    keys = np.ascontiguousarray(np.column_stack((starts, ends))).view(np.dtype((np.void, 32))).ravel()
+    reversed_keys = np.ascontiguousarray(np.column_stack((ends, starts))).view(np.dtype((np.void, 32))).ravel()
+    order = np.argsort(keys)
+    found = np.minimum(np.searchsorted(keys[order], reversed_keys), len(keys) - 1)
+    other = np.where(keys[order][found] == reversed_keys, level[order][found], 0)
+
+    wall = level > other
+    starts, ends, lower, upper = starts[wall], ends[wall], other[wall], level[wall]
+    rows = upper - lower
+    edge = np.repeat(np.arange(len(rows)), rows)
+    row = lower[edge] + np.arange(len(edge)) - np.repeat(np.cumsum(rows) - rows, rows)
+    z0, z1 = z_levels[row], z_levels[row + 1]
+    p, q = starts[edge], ends[edge]
+
+    n = len(edge)
+    vertices = np.empty((4 * n, 3))
+    vertices[:n, :2], vertices[:n, 2] = p, z0
+    vertices[n:2 * n, :2], vertices[n:2 * n, 2] = q, z0
+    vertices[2 * n:3 * n, :2], vertices[2 * n:3 * n, 2] = q, z1
+    vertices[3 * n:, :2], vertices[3 * n:, 2] = p, z1
+    i = np.arange(n)
+    walls = np.concatenate((np.column_stack((i, i + n, i + 2 * n)), np.column_stack((i, i + 2 * n, i + 3 * n))))
+    return vertices, walls
+
+
+def terrace_caps(faces, counts, z_levels):
+    # Tops of all faces and the bottom under them from one constrained
+    # triangulation of the arrangement, instead of one per face. A seed in
+    # each face carries its count to the triangles of that face (Triangle's
+    # regional attributes); a top triangle sits at z_levels[count], and
+    # the same triangles, reversed, close the bottom at z_levels[0]. Faces
+    # with count 0 (holes in every region) are left open.
+    import shapely
+    import triangle
+
+    rings = shapely.get_rings(faces)
+    coords, ring_idx = shapely.get_coordinates(rings, return_index=True)
+    same_ring = ring_idx[1:] == ring_idx[:-1]
+    points, inverse = np.unique(coords, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    segments = np.column_stack((inverse[:-1][same_ring], inverse[1:][same_ring]))
+    segments = np.unique(np.sort(segments, axis=1), axis=0)
+    seeds = shapely.get_coordinates(shapely.point_on_surface(faces))
+    regions = np.column_stack((seeds, counts, np.zeros(len(seeds))))
+    result = triangle.triangulate({"vertices": points, "segments": segments, "regions": regions}, "pQA")
+
+    triangles = result["triangles"]
+    level = np.rint(result["triangle_attributes"][:, 0]).astype(np.int64)
+    triangles, level = triangles[level > 0], level[level > 0]
+    p = result["vertices"][triangles]
+    signed = ((p[:, 1, 0] - p[:, 0, 0]) * (p[:, 2, 1] - p[:, 0, 1])
+              - (p[:, 1, 1] - p[:, 0, 1]) * (p[:, 2, 0] - p[:, 0, 0]))
+    p[signed < 0] = p[signed < 0][:, ::-1]
+
+    n = len(p)
+    vertices = np.empty((2, n, 3, 3))
+    vertices[..., :2] = p
+    vertices[0, ..., 2] = z_levels[level][:, None]
+    vertices[1, ..., 2] = z_levels[0]
+    vertices[1] = vertices[1][:, ::-1]
+    return vertices.reshape(-1, 3), np.arange(6 * n).reshape(-1, 3)
+
+
+def write_stepped_relief_stl(z, stl_path, levels, height=10, base_height=1, step=1.0, instrument=None):
+    # Quantizes the heights to `levels` layers above a base plate. The
+    # pixels that reach layer k form a binary mask, which goes through the
+    # same contour extraction as the silhouette mode. Rather than stacking
+    # one slab per layer, which leaves coincident faces between the slabs,
+    # the layers' outlines are cut into faces (terrace_faces), each face
+    # gets a top at the height of the highest layer covering it, and walls
+    # join neighbouring faces (terrace_walls). With the bottom under all of
+    # it (terrace_caps), the result is a single closed surface.
+    from shapely import affinity
+    from shapely.geometry import box
+
+    layer = (height - base_height) / levels
+    q = np.rint((z - base_height) / layer).astype(np.int32) if layer else np.zeros(z.shape, np.int32)
+    h, w = z.shape
+
+    regions = []
+    z_levels = [0.0]
+    if base_height > 0:
+        regions.append(box(0, 0, (w - 1) * step, (h - 1) * step))
+        z_levels.append(base_height)
+    for k in range(1, levels + 1):
+        with stage(instrument, "level", level=k) as rec:
+            mask = np.where(q >= k, 255, 0).astype(np.uint8)
+            contours, hierarchy = find_silhouette_contours(mask)
+            polygons = contour_polygons(contours, hierarchy)
+            rec["items"] = len(polygons)
+        if not polygons:
+            break
+        polygon = union_overlapping(polygons)
+        if step != 1.0:
+            polygon = affinity.scale(polygon, step, step, origin=(0, 0))
+        regions.append(polygon)
+        z_levels.append(base_height + k * layer)
+    z_levels = np.array(z_levels)
+
+    extrude_timer = StageTimer()
+    export_timer = StageTimer()
+    with mesh_writer(stl_path) as writer:
+        if regions:
+            with extrude_timer:
+                faces, counts = terrace_faces(regions)
+                vertices, caps = terrace_caps(faces, counts, z_levels)
+            with export_timer:
+                writer.write(vertices, caps)
+            with extrude_timer:
+                vertices, walls = terrace_walls(faces[counts > 0], counts[counts > 0], z_levels)
+            with export_timer:
+                writer.write(vertices, walls)
+    print(f"Mesh saved to: {stl_path} ({writer.count} facets)")
+
+    if instrument is not None:
+        instrument.record("extrude", extrude_timer.wall_s, extrude_timer.cpu_s, items=len(regions))
+        instrument.record("export", export_timer.wall_s, export_timer.cpu_s, items=writer.count)
+
+
+def relief_image_to_stl(image_path, stl_path, height=10, base_height=1, levels=None, max_size=1024,
+                        invert=True, instrument=None):
+    # Lithophane/relief mode: grayscale intensity becomes height instead of
+    # a flat silhouette extrusion. With levels=None the surface is a
+    # continuous heightfield; with levels=N it is N stepped layers.
+    with stage(instrument, "load") as rec:
+        img = open_image_source(image_path)
+        rec["items"] = img.size
+    with stage(instrument, "heights") as rec:
+        z, step = relief_heights(img, height, base_height, max_size, invert)
+        rec["items"] = z.size
+    print(f"Building {'stepped' if levels else 'continuous'} relief on a "
+          f"{z.shape[1]}x{z.shape[0]} grid...")
+    if levels:
+        write_stepped_relief_stl(z, stl_path, levels, height, base_height, step, instrument)
+    else:
+        write_heightfield_stl(z, stl_path, step, instrument=instrument)
+    return stl_path
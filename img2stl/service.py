@@ -0,0 +1,292 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from .pipeline import array_to_stl, warm_up
+from .shared import SharedArray, temp_path
+
+
+# Query parameters accepted by POST /convert and how to parse them.
+OPTION_TYPES = {
+    "block_size": int,
+    "C": float,
+    "height": float,
+    "simplify_tolerance": float,
+    "max_triangles": int,
+    "threshold_method": str,
+    "threshold_backend": str,
+    "open_size": int,
+    "close_size": int,
+    "min_area": int,
+}
+
+
+def ping():
+    return os.getpid()
+
+
+def convert_image_buffer(image, options, stl_target):
+    # image is the encoded file as a uint8 array; the STL is written to
+    # stl_target (a path or a seekable file object).
+    import cv2
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        img = cv2.imdecode(np.asarray(image, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError("Failed to decode image")
+        array_to_stl(img, stl_target, **options)
+
+
+def convert_shared(upload, options):
+    # Worker side of a job. The upload is mapped from the parent's shared
+    # buffer and the STL is written to a shared file whose ownership goes
+    # back to the parent, so neither is pickled.
+    stl_path = temp_path(".stl")
+    try:
+        convert_image_buffer(upload.array, options, stl_path)
+    except BaseException:
+        os.remove(stl_path)
+        raise
+    finally:
+        upload.close()
+    return SharedArray.adopt(stl_path).transfer()
+
+
+class ConversionService:
+    # A pool of warm worker processes behind a bounded job queue. At most
+    # `workers` conversions run at once and at most `queue_size` more wait;
+    # anything beyond that is turned away immediately so callers can back
+    # off instead of piling up.
+
+    def __init__(self, workers=None, queue_size=16, max_upload_bytes=64 << 20):
+        self.workers = workers or os.cpu_count()
+        self.queue_size = queue_size
+        self.max_upload_bytes = max_upload_bytes
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up)
+        self._slots = threading.BoundedSemaphore(self.workers + queue_size)
+        self._lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+
+    def warm_up(self):
+        # Start every worker now rather than on the first requests.
+        futures = [self.executor.submit(ping) for _ in range(self.workers)]
+        return sorted({f.result() for f in futures})
+
+    def try_acquire(self):
+        # Reserve a queue slot; False means the queue is full.
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def replace_executor(self, broken):
+        # A dead worker breaks the whole pool, so every later job would fail
+        # too. The first thread to notice swaps in a fresh, warmed pool; the
+        # others find it already replaced.
+        with self._pool_lock:
+            if self.executor is broken:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up)
+                self.warm_up()
+                with self._lock:
+                    self.restarts += 1
+        broken.shutdown(wait=False)
+
+    def run_job(self, upload, options):
+        executor = self.executor
+        try:
+            return executor.submit(convert_shared, upload, options).result()
+        except BrokenProcessPool:
+            self.replace_executor(executor)
+            raise
+
+    def convert(self, upload, options):
+        # Caller must hold a slot from try_acquire. upload is a SharedArray
+        # holding the encoded image; returns the STL as a SharedArray that
+        # the caller closes once it has been sent. A job whose pool broke
+        # under it (not necessarily its own fault) is tried once more in
+        # the new pool; BrokenProcessPool from that retry is raised.
+        try:
+            try:
+                stl = self.run_job(upload, options)
+            except BrokenProcessPool:
+                stl = self.run_job(upload, options)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        with self._lock:
+            self.completed += 1
+        return stl
+
+    def status(self):
+        with self._lock:
+            return {"workers": self.workers, "queue_size": self.queue_size,
+                    "in_flight": self.in_flight, "completed": self.completed, "failed": self.failed,
+                    "restarts": self.restarts}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    # POST /convert?block_size=..&C=..&height=.. with the image file as the
+    # request body returns the STL. GET /health reports queue state.
+    service = None
+    chunk_size = 1 << 20
+
+    def address_string(self):
+        # Unix socket peers have no host/port
+        return self.client_address[0] if self.client_address else "unix"
+
+    def send_json(self, code, payload, headers=()):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            self.send_json(200, self.service.status())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/convert":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        try:
+            options = {name: OPTION_TYPES[name](values[-1])
+                       for name, values in parse_qs(url.query).items()}
+        except KeyError as e:
+            self.send_json(400, {"error": f"unknown option {e.args[0]}"})
+            return
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            self.send_json(400, {"error": "empty upload"})
+            return
+        if length > self.service.max_upload_bytes:
+            self.send_json(413, {"error": "upload too large"})
+            return
+
+        if not self.service.try_acquire():
+            # Read and discard the upload so the client sees the response
+            self.rfile.read(length)
+            self.send_json(503, {"error": "queue full"}, headers=[("Retry-After", "1")])
+            return
+        try:
+            # The upload goes from the socket straight into shared memory
+            with SharedArray.empty(length) as upload:
+                self.read_into(upload.array, length)
+                stl = self.service.convert(upload, options)
+        except ConnectionError:
+            raise
+        except BrokenProcessPool as e:
+            # A worker died on this job twice: a server-side failure, not a
+            # problem with the request.
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        except Exception as e:
+            self.send_json(422, {"error": f"{type(e).__name__}: {e}"})
+            return
+        finally:
+            self.service.release()
+
+        with stl:
+            self.send_response(200)
+            self.send_header("Content-Type", "model/stl")
+            self.send_header("Content-Length", str(len(stl)))
+            self.end_headers()
+            view = memoryview(stl.array)
+            for start in range(0, len(view), self.chunk_size):
+                self.wfile.write(view[start:start + self.chunk_size])
+            view.release()
+
+    def read_into(self, array, length):
+        view = memoryview(array).cast("B")
+        received = 0
+        while received < length:
+            n = self.rfile.readinto(view[received:])
+            if not n:
+                raise ConnectionError("upload ended early")
+            received += n
+        view.release()
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def make_server(service, host="127.0.0.1", port=8000, unix_socket=None):
+    handler = type("BoundConversionHandler", (ConversionHandler,), {"service": service})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        return ThreadingUnixHTTPServer(unix_socket, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve image to STL conversions from warm worker processes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix-socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--queue-size", type=int, default=16,
+                        help="jobs allowed to wait for a worker before requests get 503")
+    parser.add_argument("--max-upload-mb", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    service = ConversionService(args.workers, args.queue_size, args.max_upload_mb << 20)
+    print(f"Warming up {service.workers} workers...")
+    service.warm_up()
+    server = make_server(service, args.host, args.port, args.unix_socket)
+    where = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"Listening on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import os
+import tempfile
+
+import numpy as np
+
+
+def shared_directory():
+    # tmpfs where available, so the files never touch a disk
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def temp_path(suffix="", directory=None):
+    fd, path = tempfile.mkstemp(prefix="img2stl-", suffix=suffix, dir=directory or shared_directory())
+    os.close(fd)
+    return path
+
+
+class SharedArray:
+    # A NumPy array backed by a memory-mapped file in shared memory, for
+    # handing large buffers (uploads, masks, STL output) between processes
+    # without copying them. Pickling a SharedArray only sends its path,
+    # shape and dtype; the receiving process maps the same pages.
+    #
+    # Lifetime is explicit: exactly one handle owns the file and deletes it
+    # on close(), other handles only unmap. A handle unpickled in another
+    # process does not own the file, unless the sender called transfer()
+    # first, e.g. when a worker returns its output to the parent.
+
+    def __init__(self, path, shape, dtype, owner=False):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = owner
+        self._transferred = False
+        self.array = np.memmap(path, dtype=self.dtype, mode="r+", shape=self.shape)
+
+    @classmethod
+    def empty(cls, shape, dtype=np.uint8, directory=None):
+        shape = tuple(np.atleast_1d(shape))
+        path = temp_path(".buf", directory)
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        os.truncate(path, max(nbytes, 1))
+        return cls(path, shape, dtype, owner=True)
+
+    @classmethod
+    def copy_of(cls, array, directory=None):
+        shared = cls.empty(array.shape, array.dtype, directory)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def adopt(cls, path):
+        # Takes ownership of an existing file, e.g. an STL written to a
+        # temp_path(), and maps it as bytes.
+        return cls(path, (os.path.getsize(path),), np.uint8, owner=True)
+
+    def transfer(self):
+        # The next unpickled copy becomes the owner; this handle no longer
+        # deletes the file.
+        self.owner = False
+        self._transferred = True
+        return self
+
+    def __reduce__(self):
+        return (SharedArray, (self.path, self.shape, self.dtype.str, self._transferred))
+
+    def __len__(self):
+        return len(self.array)
+
+    def close(self):
+        # The mapping itself goes away with the last view of the array; on
+        # POSIX the file can be removed while still mapped.
+        if self.array is None:
+            return
+        self.array = None
+        if self.owner:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # Last resort; callers are expected to close() explicitly.
+        try:
+            self.close()
+        except Exception:
+            pass
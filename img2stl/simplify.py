@@ -0,0 +1,164 @@
+import heapq
+
+import numpy as np
+
+from .geometry import polygon_parts, union_overlapping
+
+
+def count_vertices(polygon):
+    return sum(len(ring.coords) - 1
+               for poly in polygon_parts(polygon)
+               for ring in [poly.exterior, *poly.interiors])
+
+
+def count_triangles(polygon):
+    # Facets of the extruded mesh: a polygon with n vertices and h holes
+    # has n + 2h - 2 triangles per cap and 2n wall triangles.
+    return sum(4 * (len(poly.exterior.coords) - 1 + sum(len(r.coords) - 1 for r in poly.interiors))
+               + 4 * len(poly.interiors) - 4
+               for poly in polygon_parts(polygon))
+
+
+def triangle_areas(prev_xy, xy, next_xy):
+    return 0.5 * np.abs((prev_xy[:, 0] - xy[:, 0]) * (next_xy[:, 1] - xy[:, 1])
+                        - (next_xy[:, 0] - xy[:, 0]) * (prev_xy[:, 1] - xy[:, 1]))
+
+
+def visvalingam_budget(polygon, max_vertices):
+    from shapely.geometry import MultiPolygon, Polygon
+
+    # Visvalingam-Whyatt over all rings at once: a single priority queue
+    # holds the effective area of every vertex, so detail is removed
+    # wherever it matters least in the whole drawing until the total vertex
+    # count fits the budget. A ring that is down to a triangle and comes up
+    # next in the queue is dropped entirely (a hole is filled, an outer ring
+    # takes its polygon's holes with it), which is how speckles disappear.
+    parts = polygon_parts(polygon)
+    ring_coords = []
+    ring_owner = []  # polygon index of every ring; exteriors come first
+    for p, poly in enumerate(parts):
+        for ring in [poly.exterior, *poly.interiors]:
+            ring_coords.append(np.asarray(ring.coords)[:-1])
+            ring_owner.append(p)
+    if not ring_coords:
+        return MultiPolygon()
+
+    sizes = np.array([len(c) for c in ring_coords])
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    xy = np.concatenate(ring_coords)
+    ring_of = np.repeat(np.arange(len(sizes)), sizes)
+    local = np.arange(len(xy)) - starts[ring_of]
+    prev = starts[ring_of] + (local - 1) % sizes[ring_of]
+    nxt = starts[ring_of] + (local + 1) % sizes[ring_of]
+    area = triangle_areas(xy[prev], xy, xy[nxt])
+
+    alive = np.ones(len(xy), dtype=bool)
+    ring_alive = np.ones(len(sizes), dtype=bool)
+    ring_size = sizes.copy()
+    polygon_rings = {}
+    for r, p in enumerate(ring_owner):
+        polygon_rings.setdefault(p, []).append(r)
+    is_exterior = np.zeros(len(sizes), dtype=bool)
+    is_exterior[[rings[0] for rings in polygon_rings.values()]] = True
+
+    heap = list(zip(area.tolist(), range(len(xy))))
+    heapq.heapify(heap)
+    total = len(xy)
+    last_area = 0.0
+
+    def drop_ring(r):
+        nonlocal total
+        if ring_alive[r]:
+            ring_alive[r] = False
+            total -= ring_size[r]
+
+    while total > max_vertices and heap:
+        a, i = heapq.heappop(heap)
+        if not alive[i] or a != area[i]:
+            continue  # stale entry
+        r = ring_of[i]
+        if not ring_alive[r]:
+            continue
+        last_area = max(last_area, a)
+
+        if ring_size[r] <= 3:
+            if is_exterior[r]:
+                for other in polygon_rings[ring_owner[r]]:
+                    drop_ring(other)
+            else:
+                drop_ring(r)
+            continue
+
+        alive[i] = False
+        ring_size[r] -= 1
+        total -= 1
+        p, n = prev[i], nxt[i]
+        nxt[p] = n
+        prev[n] = p
+        # Neighbours never get a smaller effective area than the vertex just
+        # removed, which keeps removal order stable.
+        for j in (p, n):
+            area[j] = max(last_area, triangle_areas(xy[prev[j]][None], xy[j][None], xy[nxt[j]][None])[0])
+            heapq.heappush(heap, (area[j], j))
+
+    polygons = []
+    for p in range(len(parts)):
+        exterior = polygon_rings[p][0]
+        if not ring_alive[exterior]:
+            continue
+        # The surviving vertices of each ring, still in ring order
+        rings = [ring_coords[r][alive[starts[r]:starts[r] + sizes[r]]]
+                 for r in polygon_rings[p] if ring_alive[r]]
+        polygons.append(Polygon(rings[0], rings[1:]))
+    return repair(polygons)
+
+
+def repair(polygons):
+    # Simplifying outlines one by one can make them self-intersect or
+    # overlap their neighbours; fix them up the same way fresh contours are.
+    fixed = []
+    for poly in polygons:
+        if not poly.is_valid:
+            poly = poly.buffer(0)
+        if not poly.is_empty and poly.area > 0:
+            fixed.extend(polygon_parts(poly))
+    return union_overlapping(fixed)
+
+
+def fit_budget(polygon, max_vertices, max_triangles=None):
+    # Visvalingam may make rings cross, and repairing them adds vertices
+    # back, so one pass can end up over budget. The pass is repeated on the
+    # repaired result with a budget shrunk by the overshoot until both the
+    # vertex and (if given) the triangle count fit.
+    target = None
+    while True:
+        vertices = count_vertices(polygon)
+        ratio = max_vertices / vertices if vertices else 1.0
+        if max_triangles is not None:
+            triangles = count_triangles(polygon)
+            ratio = min(ratio, max_triangles / triangles if triangles else 1.0)
+        if ratio >= 1:
+            return polygon
+        target = max_vertices if target is None else max(0, min(target - 1, int(target * ratio)))
+        polygon = visvalingam_budget(polygon, target)
+
+
+def simplify_polygons(polygon, tolerance=None, max_vertices=None, max_triangles=None):
+    # Reduces the outline detail before extrusion, either to a geometric
+    # tolerance in output units (no vertex moves further than that from the
+    # original outline) or to a global budget. A triangle budget becomes a
+    # vertex budget: an extruded ring of n vertices costs about 4n
+    # triangles (2n for the walls, n for each cap).
+    import shapely
+
+    before = count_vertices(polygon)
+    if tolerance:
+        parts = np.array(polygon_parts(polygon), dtype=object)
+        polygon = repair(shapely.simplify(parts, tolerance, preserve_topology=False))
+    if max_triangles is not None:
+        budget = max_triangles // 4
+        max_vertices = budget if max_vertices is None else min(max_vertices, budget)
+    if max_vertices is not None:
+        polygon = fit_budget(polygon, max_vertices, max_triangles)
+    print(f"Simplified outlines from {before} to {count_vertices(polygon)} vertices.")
+    return polygon
@@ -0,0 +1,156 @@
+import os
+import re
+import struct
+
+import numpy as np
+
+
+# One binary STL facet record: normal, three vertices, attribute byte count.
+STL_FACET_DTYPE = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("vertices", "<f4", (3, 3)),
+    ("attr", "<u2"),
+])
+
+
+def open_output(target):
+    # File to write a mesh for target, a path or a file object. A path is
+    # written to a temporary file beside it, which finish_output renames
+    # into place once the mesh is complete, so a conversion that fails
+    # partway never leaves a complete-looking file at the destination.
+    # Returns the file and the temporary path (None for file objects).
+    if hasattr(target, "write"):
+        return target, None
+    tmp_path = os.fspath(target) + ".tmp"
+    return open(tmp_path, "wb"), tmp_path
+
+
+def finish_output(file, tmp_path, target):
+    file.close()
+    os.replace(tmp_path, target)
+
+
+def discard_output(file, tmp_path):
+    file.close()
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+class StlWriter:
+    # Streams a binary STL: triangles are packed into a reusable structured
+    # buffer and written chunk by chunk, so the whole mesh never has to
+    # exist in memory at once. The facet count in the header is patched in
+    # on close, which needs a seekable target. Leaving the with block by an
+    # exception aborts instead: nothing is finalized and a path target is
+    # left untouched (see open_output).
+
+    def __init__(self, target, header=b"img2stl binary STL"):
+        self.target = target
+        self.file, self._tmp_path = open_output(target)
+        self._owns_file = self._tmp_path is not None
+        if not self.file.seekable():
+            raise ValueError("StlWriter needs a seekable file")
+
+        self._start = self.file.tell()
+        self.file.write(header[:80].ljust(80, b"\0"))
+        self.file.write(struct.pack("<I", 0))
+        self.count = 0
+        self._buffer = np.zeros(0, dtype=STL_FACET_DTYPE)
+
+    def write(self, vertices, faces):
+        n = len(faces)
+        if n == 0:
+            return
+        if len(self._buffer) < n:
+            self._buffer = np.zeros(max(n, 2 * len(self._buffer)), dtype=STL_FACET_DTYPE)
+        records = self._buffer[:n]
+
+        triangles = vertices[faces]
+        normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        np.divide(normals, lengths, out=normals, where=lengths > 0)
+
+        records["normal"] = normals
+        records["vertices"] = triangles
+        self.file.write(memoryview(records).cast("B"))
+        self.count += n
+
+    def close(self):
+        try:
+            end = self.file.tell()
+            self.file.seek(self._start + 80)
+            self.file.write(struct.pack("<I", self.count))
+            self.file.seek(end)
+        except BaseException:
+            self.abort()
+            raise
+        if self._owns_file:
+            finish_output(self.file, self._tmp_path, self.target)
+
+    def abort(self):
+        # A file object target keeps what was written, with a facet count
+        # of 0 in the header.
+        if self._owns_file:
+            discard_output(self.file, self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_stl_triangles(path, mmap=True):
+    # Triangle corners of an STL as an (n, 3, 3) float32 array. Binary
+    # files are memory-mapped with STL_FACET_DTYPE, so nothing is read or
+    # copied until the triangles are used; ASCII files are parsed with one
+    # regular expression over the whole text.
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(84)
+    if len(head) == 84:
+        (count,) = struct.unpack("<I", head[80:])
+        if 84 + count * STL_FACET_DTYPE.itemsize == size:
+            if mmap:
+                records = np.memmap(path, dtype=STL_FACET_DTYPE, mode="r", offset=84, shape=(count,))
+            else:
+                records = np.fromfile(path, dtype=STL_FACET_DTYPE, offset=84, count=count)
+            return records["vertices"]
+    if head.lstrip().startswith(b"solid"):
+        with open(path, "rb") as f:
+            values = re.findall(rb"vertex\s+(\S+)\s+(\S+)\s+(\S+)", f.read())
+        return np.array(values, dtype=np.float32).reshape(-1, 3, 3)
+    raise ValueError(f"Not a valid STL file: {path}")
+
+
+def merge_vertices(vertices, faces):
+    # Merges vertices with bit-identical float32 coordinates and points the
+    # faces at the survivors: x and y are packed into one 64-bit key, so a
+    # two-key lexsort groups equal vertices.
+    vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+    if len(vertices) == 0:
+        return vertices, faces
+    bits = vertices.view(np.uint32)
+    xy = (bits[:, 0].astype(np.uint64) << np.uint64(32)) | bits[:, 1]
+    order = np.lexsort((bits[:, 2], xy))
+    xy, z = xy[order], bits[order, 2]
+    new = np.empty(len(order), dtype=bool)
+    new[0] = True
+    new[1:] = (xy[1:] != xy[:-1]) | (z[1:] != z[:-1])
+    inverse = np.empty(len(order), dtype=np.int64)
+    inverse[order] = np.cumsum(new) - 1
+    return vertices[order[new]], inverse[faces]
+
+
+def indexed_mesh(triangles, dedupe=False):
+    # (vertices, faces) from an (n, 3, 3) triangle array. Without dedupe
+    # every corner is its own vertex and faces is just 0..3n-1. With dedupe,
+    # corners with bit-identical coordinates are merged.
+    corners = np.ascontiguousarray(triangles, dtype=np.float32).reshape(-1, 3)
+    faces = np.arange(len(corners)).reshape(-1, 3)
+    if not dedupe:
+        return corners, faces
+    return merge_vertices(corners, faces)
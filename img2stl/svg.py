@@ -0,0 +1,553 @@
+import math
+import re
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from .geometry import iter_contour_children, union_overlapping
+from .instrument import stage
+
+
+def format_coords(values):
+    # Integer contour coordinates are printed as they are; anything else is
+    # rounded to 3 decimals. One join over the whole array, not one
+    # f-string per point.
+    if not np.issubdtype(values.dtype, np.integer):
+        values = np.round(values, 3)
+    return " ".join(map(str, values.ravel().tolist()))
+
+
+def contour_path_data(points, relative=True):
+    # "M x0 y0 L x1 y1 x2 y2 ... Z", or with relative=True
+    # "M x0 y0 l dx1 dy1 dx2 dy2 ... z": the deltas between neighbouring
+    # contour points are small numbers, and a minus sign doubles as a
+    # separator, so the relative form is much shorter.
+    if relative:
+        data = f"M{format_coords(points[0])}l{format_coords(np.diff(points, axis=0))}z"
+        return data.replace(" -", "-")
+    return f"M {format_coords(points[0])} L {format_coords(points[1:])} Z"
+
+
+def write_contours_svg(contours, svg_path, width, height, hierarchy=None, relative=True):
+    if hierarchy is None:
+        groups = [[i] for i in range(len(contours))]
+    else:
+        # One path per outer boundary, with its holes as extra subpaths
+        groups = [[i] + list(iter_contour_children(hierarchy, i))
+                  for i in range(len(contours)) if hierarchy[i][3] == -1]
+
+    with open(svg_path, "w") as f:
+        f.write('<?xml version="1.0" encoding="utf-8" ?>\n'
+                f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                f'viewBox="0 0 {width} {height}">\n')
+        for group in groups:
+            subpaths = []
+            for i in group:
+                points = contours[i].reshape(-1, 2)
+                if len(points) > 2:
+                    subpaths.append(contour_path_data(points, relative))
+                else:
+                    print(f"Contour {i} ignored due to insufficient points.")
+            if subpaths:
+                f.write(f'<path d="{"".join(subpaths)}" fill="black" fill-rule="evenodd"/>\n')
+        f.write("</svg>\n")
+    print(f"SVG saved to: {svg_path}")
+
+
+# Reading SVGs. Path data is split into runs of one command and turned
+# into NumPy arrays run by run: a run of relative line-tos is one cumsum,
+# a run of curves is flattened in one vectorized evaluation. Only arcs
+# and smooth quadratics are handled segment by segment.
+
+NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+NUMBER_RE = re.compile(NUMBER)
+COMMAND_RE = re.compile(r"([MmZzLlHhVvCcSsQqTtAa])")
+# Arc flags are single digits and may be written without separators
+ARC_RE = re.compile(r"[\s,]*".join([f"({NUMBER})"] * 3 + ["([01])"] * 2 + [f"({NUMBER})"] * 2))
+TRANSFORM_RE = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+
+# Containers whose content is never drawn directly
+SKIPPED_TAGS = {"defs", "clipPath", "mask", "symbol", "pattern", "marker", "linearGradient",
+                "radialGradient", "style", "script", "metadata", "title", "desc"}
+
+
+def parse_transform(text):
+    # SVG transform list as a 3x3 matrix
+    matrix = np.eye(3)
+    for name, args in TRANSFORM_RE.findall(text or ""):
+        v = [float(x) for x in NUMBER_RE.findall(args)]
+        m = np.eye(3)
+        if name == "matrix":
+            m[:2] = np.array(v[:6]).reshape(3, 2).T
+        elif name == "translate":
+            m[0, 2], m[1, 2] = v[0], v[1] if len(v) > 1 else 0
+        elif name == "scale":
+            m[0, 0], m[1, 1] = v[0], v[1] if len(v) > 1 else v[0]
+        elif name == "rotate":
+            a = math.radians(v[0])
+            cx, cy = (v[1], v[2]) if len(v) > 2 else (0, 0)
+            c, s = math.cos(a), math.sin(a)
+            m[:2, :2] = [[c, -s], [s, c]]
+            m[:2, 2] = [cx - c * cx + s * cy, cy - s * cx - c * cy]
+        elif name == "skewX":
+            m[0, 1] = math.tan(math.radians(v[0]))
+        elif name == "skewY":
+            m[1, 0] = math.tan(math.radians(v[0]))
+        matrix = matrix @ m
+    return matrix
+
+
+def element_style(element, inherited):
+    # Inherited presentation properties; a style attribute beats the
+    # plain attribute.
+    style = dict(inherited)
+    for name in ("fill", "fill-rule", "display"):
+        if name in element.attrib:
+            style[name] = element.attrib[name].strip()
+    for declaration in element.attrib.get("style", "").split(";"):
+        name, _, value = declaration.partition(":")
+        name = name.strip()
+        if name in ("fill", "fill-rule", "display"):
+            style[name] = value.strip()
+    return style
+
+
+def flatten_cubics(p0, p1, p2, p3, tolerance):
+    # Points along k cubic Beziers given as (k, 2) arrays, excluding each
+    # start point. Every segment gets as many chords as Wang's bound needs
+    # for the tolerance, and all of them are evaluated at once.
+    second = np.maximum(np.linalg.norm(p0 - 2 * p1 + p2, axis=1), np.linalg.norm(p1 - 2 * p2 + p3, axis=1))
+    n = np.maximum(1, np.ceil(np.sqrt(6 * second / (8 * tolerance)))).astype(np.int64)
+    seg = np.repeat(np.arange(len(n)), n)
+    starts = np.cumsum(n) - n
+    t = ((np.arange(len(seg)) - starts[seg] + 1) / n[seg])[:, None]
+    mt = 1 - t
+    return (mt ** 3 * p0[seg] + 3 * mt ** 2 * t * p1[seg] + 3 * mt * t ** 2 * p2[seg]
+            + t ** 3 * p3[seg])
+
+
+def flatten_arc(start, rx, ry, phi, large_arc, sweep, end, tolerance):
+    # Elliptical arc from endpoint to center parameterization (SVG 1.1
+    # appendix F.6.5), then sampled at the angle step that keeps the chords
+    # within tolerance. Excludes the start point.
+    rx, ry = abs(rx), abs(ry)
+    if rx == 0 or ry == 0 or np.array_equal(start, end):
+        return end[None]
+    cos_phi, sin_phi = math.cos(math.radians(phi)), math.sin(math.radians(phi))
+    dx, dy = (start - end) / 2
+    x1 = cos_phi * dx + sin_phi * dy
+    y1 = -sin_phi * dx + cos_phi * dy
+    scale = x1 ** 2 / rx ** 2 + y1 ** 2 / ry ** 2
+    if scale > 1:
+        rx, ry = rx * math.sqrt(scale), ry * math.sqrt(scale)
+    num = rx ** 2 * ry ** 2 - rx ** 2 * y1 ** 2 - ry ** 2 * x1 ** 2
+    factor = math.sqrt(max(0.0, num / (rx ** 2 * y1 ** 2 + ry ** 2 * x1 ** 2)))
+    if large_arc == sweep:
+        factor = -factor
+    cx1, cy1 = factor * rx * y1 / ry, -factor * ry * x1 / rx
+    center = np.array([cos_phi * cx1 - sin_phi * cy1, sin_phi * cx1 + cos_phi * cy1]) + (start + end) / 2
+
+    theta1 = math.atan2((y1 - cy1) / ry, (x1 - cx1) / rx)
+    theta2 = math.atan2((-y1 - cy1) / ry, (-x1 - cx1) / rx)
+    delta = theta2 - theta1
+    if sweep and delta < 0:
+        delta += 2 * math.pi
+    elif not sweep and delta > 0:
+        delta -= 2 * math.pi
+
+    radius = max(rx, ry)
+    step = 2 * math.acos(1 - tolerance / radius) if radius > tolerance else math.pi
+    n = max(1, math.ceil(abs(delta) / step))
+    angles = theta1 + delta * np.arange(1, n + 1) / n
+    x, y = rx * np.cos(angles), ry * np.sin(angles)
+    points = np.column_stack((cos_phi * x - sin_phi * y, sin_phi * x + cos_phi * y)) + center
+    points[-1] = end
+    return points
+
+
+def run_starts(cur, ends):
+    # Start point of every segment in a run: the current point, then the
+    # end of the previous segment.
+    return np.vstack((cur[None], ends[:-1]))
+
+
+def flatten_path(d, tolerance=0.5):
+    # Path data as a list of subpaths, each an (n, 2) array of points. Every
+    # subpath is treated as closed, since only the filled area matters.
+    subpaths = []
+    chunks = []
+    cur = start = np.zeros(2)
+    last_cubic = last_quad = None  # reflected control points for S and T
+
+    def finish():
+        if chunks:
+            subpaths.append(np.concatenate(chunks))
+            chunks.clear()
+
+    parts = COMMAND_RE.split(d)
+    for i in range(1, len(parts), 2):
+        cmd, args = parts[i], parts[i + 1]
+        upper = cmd.upper()
+        relative = cmd != upper
+        if upper == "A":
+            v = np.array(ARC_RE.findall(args), dtype=float).reshape(-1, 7)
+        else:
+            v = np.array(NUMBER_RE.findall(args), dtype=float)
+        prev_cubic, prev_quad = last_cubic, last_quad
+        last_cubic = last_quad = None
+
+        if upper == "Z":
+            finish()
+            cur = start
+            continue
+        if not chunks and upper != "M":
+            chunks.append(cur[None])
+
+        if upper in "ML":
+            pts = v[:len(v) // 2 * 2].reshape(-1, 2)
+            if len(pts) == 0:
+                continue
+            pts = cur + np.cumsum(pts, axis=0) if relative else pts
+            if upper == "M":
+                finish()
+                start = pts[0]
+            chunks.append(pts)
+        elif upper in "HV":
+            if len(v) == 0:
+                continue
+            pts = np.repeat(cur[None], len(v), axis=0)
+            axis = 0 if upper == "H" else 1
+            pts[:, axis] = cur[axis] + np.cumsum(v) if relative else v
+            chunks.append(pts)
+        elif upper in "CS":
+            k = 3 if upper == "C" else 2
+            ctrl = v[:len(v) // (2 * k) * 2 * k].reshape(-1, k, 2)
+            if len(ctrl) == 0:
+                continue
+            if relative:
+                ends = cur + np.cumsum(ctrl[:, -1], axis=0)
+                ctrl = ctrl + run_starts(cur, ends)[:, None]
+            starts = run_starts(cur, ctrl[:, -1])
+            if upper == "S":
+                # First control point mirrors the previous segment's second
+                first = np.empty_like(starts)
+                first[0] = 2 * starts[0] - prev_cubic if prev_cubic is not None else starts[0]
+                first[1:] = 2 * starts[1:] - ctrl[:-1, 0]
+                ctrl = np.concatenate((first[:, None], ctrl), axis=1)
+            chunks.append(flatten_cubics(starts, ctrl[:, 0], ctrl[:, 1], ctrl[:, 2], tolerance))
+            last_cubic = ctrl[-1, 1]
+        elif upper in "QT":
+            k = 2 if upper == "Q" else 1
+            ctrl = v[:len(v) // (2 * k) * 2 * k].reshape(-1, k, 2)
+            if len(ctrl) == 0:
+                continue
+            if relative:
+                ends = cur + np.cumsum(ctrl[:, -1], axis=0)
+                ctrl = ctrl + run_starts(cur, ends)[:, None]
+            starts = run_starts(cur, ctrl[:, -1])
+            if upper == "T":
+                # Each control point mirrors the previous one, a recurrence
+                q = np.empty_like(starts)
+                previous = prev_quad
+                for j in range(len(starts)):
+                    q[j] = 2 * starts[j] - previous if previous is not None else starts[j]
+                    previous = q[j]
+                ctrl = np.concatenate((q[:, None], ctrl), axis=1)
+            q, ends = ctrl[:, 0], ctrl[:, 1]
+            # Quadratics are elevated to cubics
+            chunks.append(flatten_cubics(starts, starts + 2 / 3 * (q - starts), ends + 2 / 3 * (q - ends),
+                                         ends, tolerance))
+            last_quad = q[-1]
+        elif upper == "A":
+            for rx, ry, phi, large_arc, sweep, x, y in v:
+                end = cur + (x, y) if relative else np.array([x, y])
+                chunks.append(flatten_arc(cur, rx, ry, phi, large_arc, sweep, end, tolerance))
+                cur = end
+            continue
+        cur = chunks[-1][-1]
+    finish()
+    return subpaths
+
+
+def shape_path_data(tag, attrib):
+    # Basic shapes as path data, so they go through the same flattening
+    def number(name, default=0.0):
+        match = NUMBER_RE.match(attrib.get(name, "").strip())
+        return float(match.group()) if match else default
+
+    if tag == "path":
+        return attrib.get("d", "")
+    if tag in ("polygon", "polyline"):
+        return "M" + attrib.get("points", "") + "Z"
+    if tag == "rect":
+        x, y, w, h = number("x"), number("y"), number("width"), number("height")
+        if w <= 0 or h <= 0:
+            return ""
+        rx, ry = number("rx", None), number("ry", None)
+        rx = ry if rx is None else rx
+        ry = rx if ry is None else ry
+        if not rx:
+            return f"M{x} {y}h{w}v{h}h{-w}z"
+        rx, ry = min(rx, w / 2), min(ry, h / 2)
+        return (f"M{x + rx} {y}h{w - 2 * rx}a{rx} {ry} 0 0 1 {rx} {ry}v{h - 2 * ry}"
+                f"a{rx} {ry} 0 0 1 {-rx} {ry}h{2 * rx - w}a{rx} {ry} 0 0 1 {-rx} {-ry}"
+                f"v{2 * ry - h}a{rx} {ry} 0 0 1 {rx} {-ry}z")
+    if tag in ("circle", "ellipse"):
+        cx, cy = number("cx"), number("cy")
+        rx = number("r") if tag == "circle" else number("rx")
+        ry = number("r") if tag == "circle" else number("ry")
+        if rx <= 0 or ry <= 0:
+            return ""
+        return f"M{cx - rx} {cy}A{rx} {ry} 0 0 1 {cx + rx} {cy}A{rx} {ry} 0 0 1 {cx - rx} {cy}z"
+    return None
+
+
+def iter_svg_shapes(svg_file, tolerance=0.5):
+    # Yields (rings, fill_rule) for every filled shape, with the rings in
+    # user units of the root element: each shape's flattened points get the
+    # accumulated group transforms in one matrix product.
+    root = ET.parse(svg_file).getroot()
+
+    def walk(element, matrix, style):
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag in SKIPPED_TAGS:
+            return
+        style = element_style(element, style)
+        if style.get("display") == "none":
+            return
+        if "transform" in element.attrib:
+            matrix = matrix @ parse_transform(element.attrib["transform"])
+
+        d = shape_path_data(tag, element.attrib)
+        if d and style.get("fill", "black") != "none":
+            # Flatten in local units, at a tolerance scaled by how much the
+            # transform magnifies
+            magnification = np.linalg.norm(matrix[:2, :2], 2) or 1.0
+            rings = flatten_path(d, tolerance / magnification)
+            if rings:
+                sizes = [len(r) for r in rings]
+                points = np.concatenate(rings) @ matrix[:2, :2].T + matrix[:2, 2]
+                yield np.split(points, np.cumsum(sizes)[:-1]), style.get("fill-rule", "nonzero")
+        for child in element:
+            yield from walk(child, matrix, style)
+
+    yield from walk(root, np.eye(3), {})
+
+
+def clean_ring(points):
+    # Drops repeated points, including a closing point equal to the first
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = np.any(np.diff(points, axis=0) != 0, axis=1)
+    points = points[keep]
+    if len(points) > 1 and np.array_equal(points[0], points[-1]):
+        points = points[:-1]
+    return points
+
+
+def winding_numbers(points, rings, point_groups=None, ring_groups=None):
+    # Winding number of every point with respect to the rings, from the
+    # signed crossings of a ray running from the point in +x. An STRtree of
+    # the ring edges finds the edges each ray may cross, so the work grows
+    # with the number of crossings rather than points times edges. With
+    # groups, each point only counts the rings of its own group, and its
+    # ray stops just past them.
+    import shapely
+
+    starts = np.concatenate(rings)
+    ends = np.concatenate([np.roll(r, -1, axis=0) for r in rings])
+    if point_groups is None:
+        point_groups = np.zeros(len(points), dtype=np.int64)
+        ring_groups = np.zeros(len(rings), dtype=np.int64)
+    edge_groups = np.repeat(ring_groups, [len(r) for r in rings])
+    right = np.full(edge_groups.max() + 1, -np.inf)
+    np.maximum.at(right, edge_groups, starts[:, 0])
+    tree = shapely.STRtree(shapely.linestrings(np.stack((starts, ends), axis=1)))
+    far = np.column_stack((right[point_groups] + 1, points[:, 1]))
+    point_idx, edge_idx = tree.query(shapely.linestrings(np.stack((points, far), axis=1)))
+    same = edge_groups[edge_idx] == point_groups[point_idx]
+    point_idx, edge_idx = point_idx[same], edge_idx[same]
+
+    x0, y0 = starts[edge_idx, 0], starts[edge_idx, 1]
+    x1, y1 = ends[edge_idx, 0], ends[edge_idx, 1]
+    px, py = points[point_idx, 0], points[point_idx, 1]
+    side = (x1 - x0) * (py - y0) - (px - x0) * (y1 - y0)
+    up = (y0 <= py) & (y1 > py) & (side > 0)
+    down = (y0 > py) & (y1 <= py) & (side < 0)
+    return np.bincount(point_idx, weights=up.astype(np.int64) - down, minlength=len(points)).astype(np.int64)
+
+
+def rings_to_polygon(rings, fill_rule="nonzero"):
+    # The filled area of one shape. The common case, an outer ring with
+    # holes that neither cross nor nest, is a plain polygon under either
+    # rule as long as (for nonzero) the holes wind the other way round.
+    # Anything else is done by fill_rings.
+    from shapely.geometry import Polygon
+
+    rings = [r for r in map(clean_ring, rings) if len(r) >= 3]
+    if not rings:
+        return Polygon()
+    areas = [signed_area(r) for r in rings]
+    shell = int(np.argmax(np.abs(areas)))
+    holes = [r for i, r in enumerate(rings) if i != shell]
+    if fill_rule == "evenodd" or all(np.sign(areas[i]) != np.sign(areas[shell])
+                                     for i in range(len(rings)) if i != shell):
+        poly = Polygon(rings[shell], holes)
+        if poly.is_valid:
+            return poly
+    return fill_rings(rings, fill_rule)
+
+
+def fill_rings(rings, fill_rule="nonzero"):
+    return fill_shapes([rings], [fill_rule])[0]
+
+
+def fill_shapes(shapes, fill_rules):
+    # The filled area of each shape, given as a list of cleaned rings, in
+    # the general way: the rings of a shape are noded together and
+    # polygonized into faces, and each face is kept if a point inside it
+    # has an odd (evenodd) or non-zero (nonzero) winding number. Every step
+    # runs once for all shapes, with one row per shape for the reductions.
+    import shapely
+    from shapely.geometry import MultiPolygon, Polygon
+
+    rings = [ring for shape in shapes for ring in shape]
+    ring_shape = np.repeat(np.arange(len(shapes)), [len(shape) for shape in shapes])
+    coords = np.concatenate([np.vstack((r, r[:1])) for r in rings])
+    lines = shapely.linestrings(coords, indices=np.repeat(np.arange(len(rings)), [len(r) + 1 for r in rings]))
+    linework = shapely.multilinestrings(lines, indices=ring_shape)
+    noded = shapely.union_all(linework[:, None], axis=1)
+    faces, face_shape = shapely.get_parts(shapely.polygonize(noded[:, None]), return_index=True)
+
+    winding = winding_numbers(shapely.get_coordinates(shapely.point_on_surface(faces)), rings,
+                              face_shape, ring_shape)
+    evenodd = np.array([fill_rule == "evenodd" for fill_rule in fill_rules], dtype=bool)[face_shape]
+    keep = np.where(evenodd, winding % 2 == 1, winding != 0)
+    faces, face_shape = faces[keep], face_shape[keep]
+
+    filled = np.full(len(shapes), None, dtype=object)
+    if len(faces):
+        merged_shapes, face_index = np.unique(face_shape, return_inverse=True)
+        merged = shapely.coverage_union_all(shapely.multipolygons(faces, indices=face_index)[:, None], axis=1)
+        filled[merged_shapes] = merged
+    for i, merged in enumerate(filled):
+        if merged is None:
+            filled[i] = Polygon()
+        elif not isinstance(merged, (Polygon, MultiPolygon)):
+            filled[i] = MultiPolygon([g for g in shapely.get_parts(merged) if isinstance(g, Polygon)])
+    return filled
+
+
+def signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def clean_rings(points, ring_ids):
+    # clean_ring for many rings at once, given as concatenated points and
+    # the ring of every point (rings contiguous and in order).
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = (ring_ids[1:] != ring_ids[:-1]) | np.any(points[1:] != points[:-1], axis=1)
+    points, ring_ids = points[keep], ring_ids[keep]
+    counts = np.bincount(ring_ids, minlength=ring_ids[-1] + 1 if len(ring_ids) else 0)
+    last = np.cumsum(counts) - 1
+    first = last - counts + 1
+    closed = (counts > 1) & np.all(points[first] == points[last], axis=1)
+    keep = np.ones(len(points), dtype=bool)
+    keep[last[closed]] = False
+    return points[keep], ring_ids[keep]
+
+
+def shapes_to_polygons(shapes):
+    # rings_to_polygon for every shape from iter_svg_shapes, as an array in
+    # shape order. The common case is settled for all shapes together:
+    # rings are cleaned and measured with array operations, the
+    # shell-plus-holes polygons are built by one shapely.polygons call and
+    # checked by one is_valid call. Only the shapes that fail go through
+    # fill_shapes, all of them together.
+    import shapely
+    from shapely.geometry import Polygon
+
+    polygons = np.full(len(shapes), None, dtype=object)
+    rings = [ring for ring_list, _ in shapes for ring in ring_list]
+    ring_shape = np.repeat(np.arange(len(shapes)), [len(ring_list) for ring_list, _ in shapes])
+    if rings:
+        points, point_ring = clean_rings(np.concatenate(rings),
+                                         np.repeat(np.arange(len(rings)), [len(r) for r in rings]))
+    else:
+        points, point_ring = np.empty((0, 2)), np.empty(0, dtype=np.int64)
+
+    # Rings left with fewer than 3 points are dropped, the rest renumbered
+    counts = np.bincount(point_ring, minlength=len(rings))
+    kept = counts >= 3
+    points, point_ring = points[kept[point_ring]], np.cumsum(kept)[point_ring[kept[point_ring]]] - 1
+    ring_shape, counts = ring_shape[kept], counts[kept]
+    ends = np.cumsum(counts)
+    starts = ends - counts
+
+    # Shoelace sums, with each ring's last point followed by its first
+    following = np.arange(1, len(points) + 1)
+    following[ends - 1] = starts
+    x, y = points[:, 0], points[:, 1]
+    areas = 0.5 * np.bincount(point_ring, weights=x * y[following] - y * x[following], minlength=len(counts))
+
+    # The shell of a shape is its ring of largest absolute area, the first
+    # one on ties like argmax
+    ring_index = np.arange(len(counts))
+    by_size = np.lexsort((ring_index, -np.abs(areas), ring_shape))
+    first = np.ones(len(by_size), dtype=bool)
+    first[1:] = ring_shape[by_size[1:]] != ring_shape[by_size[:-1]]
+    shell = np.full(len(shapes), -1)
+    shell[ring_shape[by_size[first]]] = by_size[first]
+    is_shell = shell[ring_shape] == ring_index
+
+    evenodd = np.array([fill_rule == "evenodd" for _, fill_rule in shapes], dtype=bool)
+    same_way = ~is_shell & (np.sign(areas) == np.sign(areas[shell[ring_shape]]))
+    simple = (shell >= 0) & (evenodd | (np.bincount(ring_shape, weights=same_way, minlength=len(shapes)) == 0))
+    polygons[shell < 0] = Polygon()
+
+    # Rings of the simple shapes, shell first and then the holes in their
+    # original order
+    order = np.lexsort((ring_index, ~is_shell, ring_shape))
+    order = order[simple[ring_shape[order]]]
+    if len(order):
+        sizes = counts[order]
+        point_order = np.repeat(starts[order] - (np.cumsum(sizes) - sizes), sizes) + np.arange(sizes.sum())
+        linear = shapely.linearrings(points[point_order], indices=np.repeat(np.arange(len(order)), sizes))
+        candidates, polygon_index = np.unique(ring_shape[order], return_inverse=True)
+        built = shapely.polygons(linear, indices=polygon_index)
+        valid = shapely.is_valid(built)
+        polygons[candidates[valid]] = built[valid]
+
+    # Everything else: crossing, nested or same-way rings, and invalid
+    # results of the fast path
+    rest = np.flatnonzero(polygons == None)  # noqa: E711
+    if len(rest):
+        shape_starts = np.searchsorted(ring_shape, np.arange(len(shapes) + 1))
+        polygons[rest] = fill_shapes(
+            [[points[starts[r]:ends[r]] for r in range(shape_starts[i], shape_starts[i + 1])] for i in rest],
+            [shapes[i][1] for i in rest])
+    return polygons
+
+
+def svg_to_shapely_polygons(svg_file, tolerance=0.5, instrument=None):
+    import shapely
+
+    print(f"Parsing SVG file: {svg_file}")
+    with stage(instrument, "parse") as rec:
+        shapes = list(iter_svg_shapes(svg_file, tolerance))
+        rec["items"] = len(shapes)
+    print(f"Number of filled shapes found in SVG: {len(shapes)}")
+
+    with stage(instrument, "fill") as rec:
+        filled = shapes_to_polygons(shapes)
+        filled = filled[~shapely.is_empty(filled) & (shapely.area(filled) > 0)]
+        polygons = shapely.get_parts(filled)
+        rec["items"] = len(polygons)
+
+    with stage(instrument, "union") as rec:
+        combined = union_overlapping(polygons)
+        rec["items"] = len(combined.geoms)
+    print(f"Combined polygon area: {combined.area:.2f}")
+    if combined.is_empty:
+        raise ValueError("No valid polygons found in SVG.")
+    return combined
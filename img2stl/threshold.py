@@ -0,0 +1,231 @@
+import math
+import time
+
+import numpy as np
+
+
+# Local methods compare each pixel with a statistic of its block_size
+# neighbourhood, otsu picks one level for the whole image. All of them
+# produce the same kind of mask: 255 where the pixel is darker than its
+# threshold minus C (the silhouette), 0 elsewhere.
+THRESHOLD_METHODS = ("mean", "gaussian", "otsu", "sauvola")
+
+# Sauvola's sensitivity k and dynamic range of the standard deviation R
+SAUVOLA_K = 0.2
+SAUVOLA_R = 128.0
+
+
+def gaussian_sigma(block_size):
+    # The sigma cv2.getGaussianKernel derives from the kernel size, which is
+    # what ADAPTIVE_THRESH_GAUSSIAN_C uses.
+    return 0.3 * ((block_size - 1) * 0.5 - 1) + 0.8
+
+
+def box_sum(a, size, axis):
+    # Sum over a window of `size` samples along one axis, with replicated
+    # borders, as the difference of two running sums. Applied along both
+    # axes this is the summed-area table lookup, so the cost per pixel does
+    # not depend on the window size.
+    radius = size // 2
+    pad = [(0, 0)] * a.ndim
+    pad[axis] = (radius + 1, radius)
+    running = np.cumsum(np.pad(a, pad, mode="edge"), axis=axis)
+    upper = [slice(None)] * a.ndim
+    lower = [slice(None)] * a.ndim
+    upper[axis] = slice(size, None)
+    lower[axis] = slice(None, -size)
+    return running[tuple(upper)] - running[tuple(lower)]
+
+
+def box_mean(a, size):
+    return box_sum(box_sum(a, size, 0), size, 1) / (size * size)
+
+
+# The kernels cv2.getGaussianKernel uses for these sizes when no sigma is
+# given, instead of sampling the Gaussian.
+SMALL_GAUSSIAN_KERNELS = {
+    1: [1.0],
+    3: [0.25, 0.5, 0.25],
+    5: [0.0625, 0.25, 0.375, 0.25, 0.0625],
+    7: [0.03125, 0.109375, 0.21875, 0.28125, 0.21875, 0.109375, 0.03125],
+}
+
+
+def gaussian_kernel(size):
+    # The 1D kernel of ADAPTIVE_THRESH_GAUSSIAN_C: cv2.getGaussianKernel
+    # with sigma derived from the size.
+    if size in SMALL_GAUSSIAN_KERNELS:
+        return np.array(SMALL_GAUSSIAN_KERNELS[size])
+    x = np.arange(size) - (size - 1) / 2
+    kernel = np.exp(-x * x / (2 * gaussian_sigma(size) ** 2))
+    return kernel / kernel.sum()
+
+
+def gaussian_filter(a, kernel, axis):
+    # Correlation with a symmetric kernel along one axis, with replicated
+    # borders: one pass over the array per pair of taps.
+    radius = len(kernel) // 2
+    pad = [(0, 0)] * a.ndim
+    pad[axis] = (radius, radius)
+    padded = np.pad(a, pad, mode="edge")
+
+    def shifted(offset):
+        window = [slice(None)] * a.ndim
+        window[axis] = slice(offset, offset + a.shape[axis])
+        return padded[tuple(window)]
+
+    out = kernel[radius] * shifted(radius)
+    for k in range(radius):
+        out += kernel[k] * (shifted(k) + shifted(2 * radius - k))
+    return out
+
+
+def compare_rounded(img, level, C):
+    # The comparison cv2.adaptiveThreshold does for THRESH_BINARY_INV: the
+    # local level rounded to uint8, then src - level <= -floor(C).
+    level = np.clip(np.rint(level), 0, 255)
+    return np.where(img.astype(np.int16) - level.astype(np.int16) <= -math.floor(C), 255, 0).astype(np.uint8)
+
+
+def otsu_level(img):
+    # Same search as cv2.threshold(..., THRESH_OTSU): the first level that
+    # maximizes the between-class variance of the histogram.
+    hist = np.bincount(img.ravel(), minlength=256).astype(np.float64) / img.size
+    levels = np.arange(256)
+    q1 = np.cumsum(hist)
+    mu1_sum = np.cumsum(levels * hist)
+    mu = mu1_sum[-1]
+    q2 = 1 - q1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mu1 = mu1_sum / q1
+        mu2 = (mu - mu1_sum) / q2
+        sigma = q1 * q2 * (mu1 - mu2) ** 2
+    valid = (q1 >= 1e-6) & (q2 >= 1e-6)
+    if not valid.any():
+        return 0
+    return int(np.argmax(np.where(valid, sigma, -1)))
+
+
+def sauvola_level(mean, sqr_mean):
+    std = np.sqrt(np.maximum(sqr_mean - mean * mean, 0))
+    return mean * (1 + SAUVOLA_K * (std / SAUVOLA_R - 1))
+
+
+def cv2_mean(img, block_size, C):
+    import cv2
+
+    return cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, block_size, C)
+
+
+def cv2_gaussian(img, block_size, C):
+    import cv2
+
+    return cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV,
+                                 block_size, C)
+
+
+def cv2_otsu(img, block_size, C):
+    import cv2
+
+    level, _ = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return cv2.threshold(img, level - C, 255, cv2.THRESH_BINARY_INV)[1]
+
+
+def cv2_sauvola(img, block_size, C):
+    import cv2
+
+    size = (block_size, block_size)
+    mean = cv2.boxFilter(img, cv2.CV_64F, size, borderType=cv2.BORDER_REPLICATE)
+    sqr_mean = cv2.sqrBoxFilter(img, cv2.CV_64F, size, borderType=cv2.BORDER_REPLICATE)
+    return cv2.compare(img.astype(np.float64), sauvola_level(mean, sqr_mean) - C, cv2.CMP_LE)
+
+
+def numpy_mean(img, block_size, C):
+    return compare_rounded(img, box_mean(img.astype(np.int64), block_size), C)
+
+
+def numpy_gaussian(img, block_size, C):
+    # The same separable kernel as OpenCV, in floating point. OpenCV blurs
+    # in fixed point, so a local level that lands within rounding of a
+    # half integer can round the other way: in tests up to 0.003% of the
+    # pixels differ from cv2_gaussian. The cost grows with block_size,
+    # unlike the box filters of the other methods.
+    kernel = gaussian_kernel(block_size)
+    blurred = gaussian_filter(gaussian_filter(img.astype(np.float64), kernel, 1), kernel, 0)
+    return compare_rounded(img, blurred, C)
+
+
+def numpy_otsu(img, block_size, C):
+    return np.where(img <= math.floor(otsu_level(img) - C), 255, 0).astype(np.uint8)
+
+
+def numpy_sauvola(img, block_size, C):
+    values = img.astype(np.float64)
+    level = sauvola_level(box_mean(values, block_size), box_mean(values * values, block_size))
+    return np.where(values <= level - C, 255, 0).astype(np.uint8)
+
+
+BACKENDS = {
+    "opencv": {"mean": cv2_mean, "gaussian": cv2_gaussian, "otsu": cv2_otsu, "sauvola": cv2_sauvola},
+    "numpy": {"mean": numpy_mean, "gaussian": numpy_gaussian, "otsu": numpy_otsu, "sauvola": numpy_sauvola},
+}
+
+# Backends that "auto" may choose from for each method. They must give
+# identical masks, so that the choice (which depends on timing) never
+# changes the result; numpy_gaussian still differs from OpenCV on rare
+# pixels (see there) and is used only when asked for by name.
+AUTO_BACKENDS = {
+    "mean": ("opencv", "numpy"),
+    "gaussian": ("opencv",),
+    "otsu": ("opencv", "numpy"),
+    "sauvola": ("opencv", "numpy"),
+}
+
+# Fastest backend per (method, size bucket), measured on the first image
+# of each bucket in this process.
+_fastest = {}
+
+
+def size_bucket(shape, block_size):
+    # Images within a factor of two in pixel count, with block sizes within
+    # a factor of two, share a measurement.
+    return (int(shape[0] * shape[1]).bit_length(), int(block_size).bit_length())
+
+
+def select_backend(method, shape, block_size):
+    # The backend that was fastest for this kind of image so far, or None
+    # if it has not been measured yet.
+    return _fastest.get((method, size_bucket(shape, block_size)))
+
+
+def adaptive_threshold(img, block_size, C=0, method="mean", backend="opencv"):
+    # Binary mask of img using one of THRESHOLD_METHODS. backend is
+    # "opencv", "numpy" or "auto". "auto" is opt-in: the first image of each
+    # size bucket is thresholded by every backend in AUTO_BACKENDS, timed,
+    # and the fastest one is used for that bucket from then on. That first
+    # measurement costs an extra pass in every fresh process.
+    if method not in THRESHOLD_METHODS:
+        raise ValueError(f"Unknown threshold method {method!r}, expected one of {', '.join(THRESHOLD_METHODS)}")
+    if backend != "auto":
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown threshold backend {backend!r}, expected auto or one of {', '.join(BACKENDS)}")
+        return BACKENDS[backend][method](img, block_size, C)
+
+    candidates = AUTO_BACKENDS[method]
+    name = select_backend(method, img.shape, block_size)
+    if name is None and len(candidates) == 1:
+        name = candidates[0]
+    if name is not None:
+        return BACKENDS[name][method](img, block_size, C)
+
+    timings = {}
+    results = {}
+    for name in candidates:
+        start = time.perf_counter()
+        results[name] = BACKENDS[name][method](img, block_size, C)
+        timings[name] = time.perf_counter() - start
+    name = min(timings, key=timings.get)
+    _fastest[(method, size_bucket(img.shape, block_size))] = name
+    print(f"Threshold backend for {method} at {img.shape[1]}x{img.shape[0]}: {name} "
+          f"({', '.join(f'{n} {t * 1000:.1f}ms' for n, t in timings.items())})")
+    return results[name]
@@ -0,0 +1,150 @@
+import numpy as np
+
+from .export import mesh_writer
+from .extrude import extrude_polygon
+from .geometry import contour_polygons, polygon_parts, separate_touching_rings, union_overlapping
+from .instrument import StageTimer, stage
+from .raster import clean_binary, find_silhouette_contours, load_grayscale, normalize_block_size, threshold_image
+from .simplify import simplify_polygons
+
+
+def read_pgm_header(f):
+    # Binary 8-bit PGM: "P5 <width> <height> <maxval>" followed by one byte
+    # of whitespace and the raw pixels. Comments start with '#'.
+    fields = []
+    token = b""
+    while len(fields) < 4:
+        c = f.read(1)
+        if not c:
+            raise ValueError("Truncated PGM header")
+        if c == b"#":
+            f.readline()
+        elif c.isspace():
+            if token:
+                fields.append(token)
+                token = b""
+        else:
+            token += c
+    if fields[0] != b"P5" or int(fields[3]) > 255:
+        raise ValueError("Only binary 8-bit PGM files can be tiled from disk")
+    return int(fields[1]), int(fields[2]), f.tell()
+
+
+def open_image_source(image_path):
+    # .npy and binary .pgm files are memory-mapped, so each tile is only read
+    # from disk when it is sliced. Other formats have to be decoded whole by
+    # OpenCV first; only the later stages are bounded by the tile size then.
+    lower = image_path.lower()
+    if lower.endswith(".npy"):
+        img = np.load(image_path, mmap_mode="r")
+        if img.ndim != 2 or img.dtype != np.uint8:
+            raise ValueError("Tiled .npy input must be a 2D uint8 array")
+        return img
+    if lower.endswith(".pgm"):
+        with open(image_path, "rb") as f:
+            width, height, offset = read_pgm_header(f)
+        return np.memmap(image_path, dtype=np.uint8, mode="r", offset=offset, shape=(height, width))
+    return load_grayscale(image_path)
+
+
+def iter_tile_polygons(img, tile_size=4096, block_size=140, C=0, instrument=None, threshold_method="mean",
+                       open_size=0, close_size=0, threshold_backend="opencv"):
+    # Yields (polygons, touches_seam) per tile. Each tile is thresholded
+    # with a halo of block_size // 2 pixels, so the adaptive mean of every
+    # pixel sees the same neighbourhood as in a full-image pass (for the
+    # local threshold methods; otsu needs the whole image). Tiles also
+    # share one row/column of pixels with their right and bottom neighbours,
+    # which makes the contour polygons of a shape cut by a seam meet edge to
+    # edge, ready to be unioned back together.
+    height, width = img.shape
+    # The halo also covers the reach of the opening and closing, which
+    # are cleaned up before the halo is cut off again.
+    radius = normalize_block_size(block_size) // 2 + open_size + close_size
+
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            y1 = min(y0 + tile_size + 1, height)
+            x1 = min(x0 + tile_size + 1, width)
+            hy0, hx0 = max(y0 - radius, 0), max(x0 - radius, 0)
+            hy1, hx1 = min(y1 + radius, height), min(x1 + radius, width)
+
+            with stage(instrument, "tile", x=x0, y=y0) as rec:
+                tile = np.ascontiguousarray(img[hy0:hy1, hx0:hx1])
+                binary = threshold_image(tile, block_size, C, threshold_method, threshold_backend)
+                binary = clean_binary(binary, open_size, close_size)
+                binary = np.ascontiguousarray(binary[y0 - hy0:y1 - hy0, x0 - hx0:x1 - hx0])
+                contours, hierarchy = find_silhouette_contours(binary)
+                polygons = contour_polygons(contours, hierarchy, offset=(x0, y0))
+                rec["items"] = len(polygons)
+
+            # Seams are the tile edges that are not also image edges
+            touches_seam = []
+            for poly in polygons:
+                minx, miny, maxx, maxy = poly.bounds
+                touches_seam.append((x0 > 0 and minx == x0) or (x1 < width and maxx == x1 - 1)
+                                    or (y0 > 0 and miny == y0) or (y1 < height and maxy == y1 - 1))
+            yield polygons, touches_seam
+
+
+def tiled_image_to_stl(image_path, stl_path, tile_size=4096, block_size=140, C=0, height=10,
+                       instrument=None, simplify_tolerance=None, threshold_method="mean", open_size=0,
+                       close_size=0, threshold_backend="opencv"):
+    from shapely.geometry import MultiPolygon
+
+    # Polygons that lie inside a single tile are extruded and streamed to the
+    # STL as soon as their tile is done. Only polygons that reach a seam are
+    # kept until the end, when they are stitched with union_overlapping.
+    # Instrumentation gets one "tile" record per tile (threshold, contours
+    # and polygons), plus totals for the other stages. A triangle budget
+    # needs every polygon at once, so only tolerance-based simplification
+    # is available here.
+    with stage(instrument, "load") as rec:
+        img = open_image_source(image_path)
+        rec["items"] = img.size
+    print(f"Processing {img.shape[1]}x{img.shape[0]} image in tiles of {tile_size}px...")
+
+    def write(polygon):
+        if simplify_tolerance:
+            with simplify_timer:
+                polygon = simplify_polygons(polygon, simplify_tolerance)
+        parts = polygon_parts(separate_touching_rings(polygon))
+        for poly in parts:
+            with extrude_timer:
+                vertices, faces = extrude_polygon(poly, height)
+            with export_timer:
+                writer.write(vertices, faces)
+        return len(parts)
+
+    pending = []
+    extruded = 0
+    simplify_timer = StageTimer()
+    extrude_timer = StageTimer()
+    export_timer = StageTimer()
+    with mesh_writer(stl_path) as writer:
+        for polygons, touches_seam in iter_tile_polygons(img, tile_size, block_size, C, instrument,
+                                                         threshold_method, open_size, close_size,
+                                                         threshold_backend):
+            done = []
+            for poly, seam in zip(polygons, touches_seam):
+                if seam:
+                    pending.append(poly)
+                else:
+                    done.extend(polygon_parts(poly))
+            extruded += write(MultiPolygon(done))
+
+        print(f"Stitching {len(pending)} polygons across tile seams...")
+        with stage(instrument, "union") as rec:
+            stitched = union_overlapping(pending)
+            rec["items"] = len(pending)
+        extruded += write(stitched)
+
+    if instrument is not None:
+        if simplify_tolerance:
+            instrument.record("simplify", simplify_timer.wall_s, simplify_timer.cpu_s, items=extruded)
+        instrument.record("extrude", extrude_timer.wall_s, extrude_timer.cpu_s, items=extruded)
+        instrument.record("export", export_timer.wall_s, export_timer.cpu_s, items=writer.count)
+
+    if writer.count == 0:
+        raise ValueError("No valid polygons found in image.")
+    print(f"Mesh saved to: {stl_path} ({writer.count} facets)")
+    return stl_path
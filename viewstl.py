@@ -1,49 +1,72 @@
-from stl import mesh
-from mpl_toolkits import mplot3d
-import matplotlib.pyplot as plt
+import numpy as np
 import tkinter as tk
 from tkinter import filedialog
-import pyvista as pv
-from stl import mesh
+
+from img2stl.lod import facet_count, iter_lods, lod_within
+from img2stl.stl import indexed_mesh, read_stl_triangles
+
+# Poly3DCollection gets unusably slow beyond this many triangles
+MATPLOTLIB_MAX_FACETS = 20000
+
 
 def viewStl(stl_path):
-    # Load the STL file
-    your_mesh = mesh.Mesh.from_file(stl_path)
+    from mpl_toolkits import mplot3d
+    import matplotlib.pyplot as plt
+
+    # Load the STL file, or its most detailed preview level that
+    # matplotlib can still draw
+    triangles = read_stl_triangles(lod_within(stl_path, MATPLOTLIB_MAX_FACETS))
 
     # Create a new plot
     figure = plt.figure()
     axes = mplot3d.Axes3D(figure)
 
-    # Load the vectors from the STL mesh and add them to the plot
-    axes.add_collection3d(mplot3d.art3d.Poly3DCollection(your_mesh.vectors))
+    # Add the triangles to the plot
+    axes.add_collection3d(mplot3d.art3d.Poly3DCollection(triangles))
 
     # Auto scale to the mesh size
-    scale = your_mesh.points.flatten()
+    scale = triangles.ravel()
     axes.auto_scale_xyz(scale, scale, scale)
 
     plt.show()
 
 
-def viewpystl(stl_path):
-    # Read STL file
-    your_mesh = mesh.Mesh.from_file(stl_path)
+def stl_to_polydata(stl_path, dedupe=False):
+    import pyvista as pv
+
+    # The STL is memory-mapped and the PyVista face array, [3, a, b, c] per
+    # triangle, is built in one go.
+    vertices, faces = indexed_mesh(read_stl_triangles(stl_path), dedupe)
+    cells = np.empty((len(faces), 4), dtype=np.int64)
+    cells[:, 0] = 3  # '3' means triangle with 3 points
+    cells[:, 1:] = faces
+    return pv.PolyData(vertices, cells.ravel())
+
+
+def viewpystl(stl_path, dedupe=False):
+    import pyvista as pv
 
-    # Create a PyVista mesh
-    points = your_mesh.vectors.reshape(-1, 3)
-    faces = []
-    for i in range(len(your_mesh.vectors)):
-        faces.append([3, i*3, i*3+1, i*3+2])  # '3' means triangle with 3 points
+    # Start with the coarsest preview level; each press of 'r' swaps in
+    # the next finer one, up to the full-resolution STL.
+    levels = iter_lods(stl_path)
 
-    faces = [item for sublist in faces for item in sublist]  # flatten the list
-    pv_mesh = pv.PolyData(points, faces)
+    def show(path):
+        plotter.add_mesh(stl_to_polydata(path, dedupe), color='lightblue', name="mesh")
+        detail = "full resolution" if path == stl_path else "preview, press r to refine"
+        plotter.add_text(f"{facet_count(path)} triangles ({detail})", name="detail", font_size=10)
+
+    def refine():
+        path = next(levels, None)
+        if path is not None:
+            show(path)
 
     # Plot using pyvista
     plotter = pv.Plotter()
-    plotter.add_mesh(pv_mesh, color='lightblue')
+    show(next(levels))
+    plotter.add_key_event("r", refine)
     plotter.show()
 
 
-
 def upload_file():
     filepath = filedialog.askopenfilename(
         title="Select a file",
@@ -55,17 +78,15 @@ def upload_file():
         # You can add code here to process the file
 
 
+def main():
+    root = tk.Tk()
+    root.title("Upload STL File")
 
-root = tk.Tk()
-root.title("Upload STL File")
-
-upload_button = tk.Button(root, text="Upload STL File", command=upload_file)
-upload_button.pack(pady=20, padx=20)
-
-root.mainloop()
-
-
-
+    upload_button = tk.Button(root, text="Upload STL File", command=upload_file)
+    upload_button.pack(pady=20, padx=20)
 
+    root.mainloop()
 
 
+if __name__ == "__main__":
+    main()